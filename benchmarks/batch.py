@@ -0,0 +1,145 @@
+"""Outbound calls of `/places/chat:batch` against the same chats sent one by one.
+
+Builds `groups` chats from a few conversation templates, as when suggestions
+are precomputed for scheduled events, with groups spread around the same
+city. Against the local stand-ins of `benchmarks/fakes.py`, it sends them as
+separate `/places/chat` streams, at most `BATCH_MAX_CONCURRENCY` at a time,
+then as one batch, with fresh caches for each. It reports the wall time, the
+time to the first result, and the LLM calls and Maps searches per chat.
+
+Run from the repository root:
+    python -m benchmarks.batch
+    python -m benchmarks.batch --groups 64 --templates 16
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+
+import aiohttp
+import uvicorn
+
+import routers.places
+import utils.conversation
+import utils.llm
+from benchmarks.fakes import FakeGenAIClient, FakeMapsServer, Latency
+from benchmarks.load import CITY_CENTER, USER_MESSAGES, reset_caches, run_chat
+from server import app
+from utils.constants import BATCH_MAX_CONCURRENCY
+from utils.llm import LLMScheduler
+from utils.maps import maps_client
+
+GROUP_SPREAD_DEGREES = 0.02
+
+
+def group_bodies(groups: int, templates: int, rng: random.Random) -> list:
+    """Build chat requests for groups that share a few conversations."""
+    conversations = [
+        [
+            {"role": "user", "content": rng.choice(USER_MESSAGES)},
+            {"role": "model", "content": "Noted, anything else?"},
+            {"role": "user", "content": rng.choice(USER_MESSAGES)},
+        ]
+        for _ in range(templates)
+    ]
+    bodies = []
+    for i in range(groups):
+        users = [
+            {
+                "name": f"user{j}",
+                "location": {
+                    "latitude": CITY_CENTER[0] + rng.uniform(-GROUP_SPREAD_DEGREES, GROUP_SPREAD_DEGREES),
+                    "longitude": CITY_CENTER[1] + rng.uniform(-GROUP_SPREAD_DEGREES, GROUP_SPREAD_DEGREES),
+                },
+            }
+            for j in range(3)
+        ]
+        bodies.append({
+            "messages": conversations[i % templates],
+            "userLocations": users,
+            "streamMode": "delta",
+        })
+    return bodies
+
+
+async def run_separate(session: aiohttp.ClientSession, url: str, bodies: list) -> tuple:
+    """Send every chat as its own stream, `BATCH_MAX_CONCURRENCY` at a time."""
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    start = time.perf_counter()
+
+    async def limited(body: dict) -> float:
+        async with semaphore:
+            result = await run_chat(session, url, body)
+            return time.perf_counter() - start if result.ok else float("nan")
+
+    done = await asyncio.gather(*[limited(body) for body in bodies])
+    return time.perf_counter() - start, min(done)
+
+
+async def run_batch(session: aiohttp.ClientSession, url: str, bodies: list) -> tuple:
+    """Send every chat in one batch, reading the NDJSON lines as they come."""
+    start = time.perf_counter()
+    first_line = None
+    async with session.post(url, json={"requests": bodies}) as response:
+        async for line in response.content:
+            if line.strip():
+                if "error" in json.loads(line):
+                    raise RuntimeError(line)
+                if first_line is None:
+                    first_line = time.perf_counter() - start
+    return time.perf_counter() - start, first_line
+
+
+async def main(args: argparse.Namespace) -> None:
+    maps = FakeMapsServer(latency=Latency(args.maps_latency, 0.3 * args.maps_latency), seed=args.seed)
+    llm = FakeGenAIClient(
+        latency=Latency(args.llm_latency, 0.3 * args.llm_latency),
+        stream_latency=Latency(0.01, 0.003),
+        seed=args.seed,
+    )
+    maps_client.base_url = await maps.start()
+    # The app warms up the default scheduler's client at startup
+    utils.llm.scheduler.client = llm
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    base = f"http://127.0.0.1:{sock.getsockname()[1]}/places"
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    bodies = group_bodies(args.groups, args.templates, random.Random(args.seed))
+    print(f"{'mode':<10}{'chats':>7}{'wall s':>8}{'first s':>9}{'llm/chat':>10}{'maps/chat':>11}")
+    timeout = aiohttp.ClientTimeout(total=None)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            for mode, run, url in [
+                ("separate", run_separate, f"{base}/chat"),
+                ("batch", run_batch, f"{base}/chat:batch"),
+            ]:
+                reset_caches()
+                routers.places.scheduler = utils.conversation.scheduler = LLMScheduler(llm)
+                llm_calls, maps_calls = llm.calls, maps.calls
+                wall, first = await run(session, url, bodies)
+                chats = len(bodies)
+                print(
+                    f"{mode:<10}{chats:>7}{wall:>8.2f}{first:>9.2f}"
+                    f"{(llm.calls - llm_calls) / chats:>10.1f}{(maps.calls - maps_calls) / chats:>11.1f}"
+                )
+    finally:
+        server.should_exit = True
+        await serving
+        await maps.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--groups", type=int, default=32)
+    parser.add_argument("--templates", type=int, default=8, help="Distinct conversations among the groups")
+    parser.add_argument("--maps-latency", type=float, default=0.15)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,333 @@
+"""Local stand-ins for the Places API and the Gemini client.
+
+`FakeMapsServer` serves `places:searchText` on localhost by replaying the payloads in `benchmarks/fixtures`, moved next to the request's
+bias center so distances stay meaningful, and trimmed to the field mask. `FakeGenAIClient` mimics `client.aio.models`: it
+answers each structured call with a valid object of the requested schema and
+streams a canned justification. Conversation summaries are the distinct
+messages of the conversation. It also stands in for `client.aio.caches`,
+keeping registered prompt prefixes in memory and resolving `cached_content`
+against them. Both take a `Latency` and an error rate, and count the calls
+they serve (and Maps the bytes it sends, the LLM the prompt characters it
+receives).
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import typing
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional
+
+from aiohttp import web
+from google.genai import errors
+
+from models.place import AffectedCriteria, PlaceRanking, SearchQueries, UserPreferences
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+# Queries handed out by the fake query generation, a few per conversation
+QUERY_POOL = [
+    "pizza restaurants",
+    "italian restaurants",
+    "bars with live music",
+    "cafes",
+    "brunch restaurants",
+    "wine bars",
+]
+
+JUSTIFICATION = (
+    "These places fit the group best: they are central for everyone, well rated "
+    "and match what was asked for in the conversation. The top pick balances "
+    "travel time across the group with the strongest match on food and atmosphere."
+)
+
+# Grid the fixtures are moved onto, about 5 km
+FIXTURE_GRID_DEGREES = 0.05
+
+_TABLE_ID = re.compile(r"^([^\s|]+) \|", re.M)
+_SUMMARY_HISTORY = re.compile(r"Summarize the conversation.*?Conversation History:\n(.*?)\n\nIn your response", re.S)
+
+
+@dataclass
+class Latency:
+    """Latency of a fake call: uniform in [mean - jitter, mean + jitter] seconds."""
+    mean: float = 0.0
+    jitter: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return max(0.0, rng.uniform(self.mean - self.jitter, self.mean + self.jitter))
+
+
+def load_fixture_places() -> List[List[dict]]:
+    """Load the recorded `places` arrays of the searchText fixtures."""
+    return [
+        json.loads(path.read_text())["places"]
+        for path in sorted(FIXTURES.glob("search_text_*.json"))
+    ]
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+
+
+def _apply_field_mask(place: dict, field_mask: str, prefix: str = "") -> dict:
+    """Keep the top-level fields of a place named in a field mask."""
+    fields = {field[len(prefix):] for field in field_mask.split(",") if field.startswith(prefix)}
+    if "*" in fields:
+        return place
+    return {key: value for key, value in place.items() if key in fields}
+
+
+class FakeMapsServer:
+    """aiohttp server answering `places:searchText` from the fixtures.
+
+    Each query picks a fixture and a page of it deterministically, so the same
+    query always gets the same places and different queries overlap. Places
+    only carry the fields of the request's field mask. Failed calls answer 503.
+    """
+
+    def __init__(
+        self,
+        latency: Latency = Latency(),
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._fixtures = load_fixture_places()
+        self._runner: Optional[web.AppRunner] = None
+        self.url = ""
+
+    async def _fail_or_wait(self) -> Optional[web.Response]:
+        await asyncio.sleep(self.latency.sample(self._rng))
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": {"code": 503}}, status=503)
+        return None
+
+    def _respond(self, data: dict) -> web.Response:
+        body = json.dumps(data).encode()
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    async def _search_text(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        failure = await self._fail_or_wait()
+        if failure is not None:
+            return failure
+
+        body = await request.json()
+        page_size = int(request.query.get("pageSize", 20))
+        center = body["locationBias"]["circle"]["center"]
+        query_hash = _stable_hash(" ".join(body["textQuery"].lower().split()))
+
+        fixture = self._fixtures[query_hash % len(self._fixtures)]
+        start = query_hash % len(fixture)
+        page = [fixture[(start + i) % len(fixture)] for i in range(min(page_size, len(fixture)))]
+
+        # Move the fixture next to the bias center, snapped to a grid so that a
+        # place keeps its location across nearby searches, as real places do
+        located = [place["location"] for place in fixture if "location" in place]
+        mean_latitude = sum(location["latitude"] for location in located) / len(located)
+        mean_longitude = sum(location["longitude"] for location in located) / len(located)
+        center = {
+            axis: round(value / FIXTURE_GRID_DEGREES) * FIXTURE_GRID_DEGREES
+            for axis, value in center.items()
+        }
+        field_mask = request.headers.get("X-Goog-FieldMask", "places.*")
+        places = []
+        for place in page:
+            place = _apply_field_mask(place, field_mask, "places.")
+            place = dict(place)
+            if "location" in place:
+                place["location"] = {
+                    "latitude": place["location"]["latitude"] - mean_latitude + center["latitude"],
+                    "longitude": place["location"]["longitude"] - mean_longitude + center["longitude"],
+                }
+            places.append(place)
+        return self._respond({"places": places})
+
+    async def start(self) -> str:
+        """Start the server on a free localhost port.
+
+        Returns:
+            The searchText URL to point `MapsClient.base_url` at.
+        """
+        app = web.Application()
+        app.router.add_post("/v1/places:searchText", self._search_text)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        await web.SockSite(self._runner, sock).start()
+        self.url = f"http://127.0.0.1:{port}/v1/places:searchText"
+        return self.url
+
+    async def stop(self) -> None:
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class FakeResponse:
+    """The parts of `GenerateContentResponse` the app reads."""
+
+    def __init__(self, parsed=None, text: Optional[str] = None):
+        self.parsed = parsed
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeCaches:
+    """Fake `client.aio.caches`, keeping the registered contents in memory."""
+
+    def __init__(self):
+        self.contents: dict = {}
+        self.creates = 0
+
+    async def create(self, model: str, config=None) -> SimpleNamespace:
+        self.creates += 1
+        name = f"cachedContents/fake-{self.creates}"
+        self.contents[name] = config.contents
+        return SimpleNamespace(name=name, model=model)
+
+    def resolve(self, name: str):
+        """Get the contents registered under `name`, failing like the API if unknown."""
+        if name not in self.contents:
+            raise errors.ClientError(404, {"error": {"message": "not found", "status": "NOT_FOUND"}})
+        return self.contents[name]
+
+
+class FakeModels:
+    """Fake `client.aio.models`."""
+
+    def __init__(
+        self,
+        latency: Latency,
+        stream_latency: Latency,
+        error_rate: float,
+        seed: int,
+        caches: FakeCaches,
+    ):
+        self.latency = latency
+        self.stream_latency = stream_latency
+        self.error_rate = error_rate
+        self.caches = caches
+        self.calls = 0
+        self.errors = 0
+        self.prompt_chars = 0
+        self._rng = random.Random(seed)
+
+    async def _fail_or_wait(self, latency: Latency) -> None:
+        self.calls += 1
+        await asyncio.sleep(latency.sample(self._rng))
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            raise errors.APIError(503, {"error": {"message": "unavailable", "status": "UNAVAILABLE"}})
+
+    def _criteria(self, model) -> dict:
+        return {
+            name: round(self._rng.choice([-1.0, self._rng.random()]), 2)
+            for name in model.model_fields
+            if name not in ("id", "score")
+        }
+
+    def _parse(self, schema, contents):
+        if schema is SearchQueries:
+            count = 2 + len(contents) % 2 if isinstance(contents, list) else 2
+            # Queries whose keyword the conversation names come first, like a real model's
+            text = str(contents).lower()
+            queries = [query for query in QUERY_POOL if query.split()[0] in text][:count]
+            start = _stable_hash(str(contents)) % len(QUERY_POOL)
+            for i in range(len(QUERY_POOL)):
+                if len(queries) == count:
+                    break
+                if QUERY_POOL[(start + i) % len(QUERY_POOL)] not in queries:
+                    queries.append(QUERY_POOL[(start + i) % len(QUERY_POOL)])
+            return SearchQueries(queries=queries)
+        if schema is PlaceRanking:
+            return PlaceRanking(id="", **self._criteria(PlaceRanking))
+        if schema is UserPreferences:
+            return UserPreferences(place_id="", score=round(self._rng.random(), 2))
+        if schema is AffectedCriteria:
+            criteria = [name for name in PlaceRanking.model_fields if name != "id"]
+            return AffectedCriteria(criteria=self._rng.sample(criteria, self._rng.randint(0, 3)))
+        if typing.get_origin(schema) is list:
+            # Batched scoring: one item per row of the places table
+            item = typing.get_args(schema)[0]
+            ids = _TABLE_ID.findall(str(contents))[1:]
+            return [
+                item(id=place_id, score=round(self._rng.random(), 2), **self._criteria(item))
+                for place_id in ids
+            ]
+        return None
+
+    async def generate_content(self, model: str, contents, config=None) -> FakeResponse:
+        self.prompt_chars += len(str(contents))
+        if getattr(config, "cached_content", None):
+            contents = str(self.caches.resolve(config.cached_content)) + str(contents)
+        await self._fail_or_wait(self.latency)
+        schema = getattr(config, "response_schema", None)
+        summary = _SUMMARY_HISTORY.search(str(contents))
+        if schema is None and summary:
+            # The distinct messages: a turn that repeats what was said keeps the summary
+            return FakeResponse(text="\n".join(sorted(set(summary.group(1).splitlines()))))
+        if schema is None:
+            return FakeResponse(text=JUSTIFICATION)
+        return FakeResponse(parsed=self._parse(schema, contents))
+
+    async def get(self, model: str) -> SimpleNamespace:
+        # Model metadata, used to warm up connections, is not counted as a call
+        await asyncio.sleep(self.latency.sample(self._rng))
+        return SimpleNamespace(name=f"models/{model}")
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        self.prompt_chars += len(str(contents))
+        await self._fail_or_wait(self.latency)
+
+        async def chunks():
+            words = JUSTIFICATION.split(" ")
+            for i in range(0, len(words), 8):
+                await asyncio.sleep(self.stream_latency.sample(self._rng))
+                yield FakeResponse(text=" ".join(words[i : i + 8]) + " ")
+
+        return chunks()
+
+
+class FakeGenAIClient:
+    """Drop-in for `genai.Client` as used through `LLMScheduler`."""
+
+    def __init__(
+        self,
+        latency: Latency = Latency(),
+        stream_latency: Latency = Latency(),
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        caches = FakeCaches()
+        self.aio = SimpleNamespace(
+            models=FakeModels(latency, stream_latency, error_rate, seed, caches),
+            caches=caches,
+        )
+
+    @property
+    def calls(self) -> int:
+        return self.aio.models.calls
+
+    @property
+    def errors(self) -> int:
+        return self.aio.models.errors
+
+    @property
+    def prompt_chars(self) -> int:
+        return self.aio.models.prompt_chars
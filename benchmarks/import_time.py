@@ -0,0 +1,76 @@
+"""Import-time budget check of the app.
+
+Imports `server` in a fresh interpreter with `python -X importtime`, prints
+the total, the slowest modules by cumulative time and the module-level work
+of the app's own modules, and exits with status 1 if the total exceeds the
+budget. Importing the app should not build clients, open connections or load
+files beyond the optional on-disk caches: that belongs to the lifespan and
+the warm-up (see `utils.warmup`). The import is repeated and the fastest run
+kept, as the first one may pay for a cold file cache.
+
+Run from the repository root:
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --budget 1.5 --top 20
+"""
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+FIRST_PARTY = ("server", "routers", "utils", "models")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def import_times(module: str) -> list:
+    """Import a module in a fresh interpreter.
+
+    Returns:
+        The (module, self microseconds, cumulative microseconds, depth) of
+        every import.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return times
+
+
+def main(args: argparse.Namespace) -> int:
+    runs = [import_times(args.module) for _ in range(args.repeats)]
+    times = min(runs, key=lambda run: sum(cumulative for _, _, cumulative, depth in run if depth == 0))
+    total = sum(cumulative for _, _, cumulative, depth in times if depth == 0) / 1e6
+
+    print(f"Slowest imports of {args.module}, cumulative:")
+    for name, _, cumulative, _ in sorted(times, key=lambda entry: -entry[2])[: args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print("Module-level work of the app's own modules:")
+    own = [entry for entry in times if entry[0].split(".")[0] in FIRST_PARTY]
+    for name, self_us, _, _ in sorted(own, key=lambda entry: -entry[1])[: args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    print(f"Total: {total:.3f} s, budget: {args.budget:.3f} s")
+    if total > args.budget:
+        print("Over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--budget", type=float, default=2.0, help="Seconds allowed for the import")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=3)
+    sys.exit(main(parser.parse_args()))
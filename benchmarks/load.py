@@ -0,0 +1,326 @@
+"""Load test of `/places/chat` against local Maps and Gemini stand-ins.
+
+Starts the real app with uvicorn on a free localhost port, points the Maps
+client at a `FakeMapsServer` and the LLM scheduler at a `FakeGenAIClient`
+(see `benchmarks/fakes.py`), then runs each scenario: `requests` chats, at
+most `concurrency` at a time, for groups of `group_size` users with
+conversations of `conversation_length` messages. Search, score and place
+caches are reset before every scenario unless `--warm` is given, and are
+always fresh in-memory ones, so on-disk caches are never touched. Scenarios
+with several `turns` send each conversation again with one more user message
+and a `conversationId`, so later turns are incremental follow-ups. Scenarios
+with several `duplicates` send each conversation that many times at once, as
+when every member of a group opens the chat together. Every
+scenario gets its own LLM scheduler, so rate limits used up by one scenario
+do not slow down the next.
+
+For each scenario it reports throughput, p50/p95/p99 latency to the end of
+the stream, p50/p95 time to the first SSE event, failed requests and the
+average number of LLM calls and Maps searches, kilobytes received from Maps and thousands of prompt characters sent to the LLM per
+chat. `--context-cache` registers the shared scoring prefix
+with the fake context cache, whatever its size (see `utils.context_cache`).
+
+Run from the repository root:
+    python -m benchmarks.load
+    python -m benchmarks.load --scenario concurrent --llm-latency 0.4 --error-rate 0.02
+    python -m benchmarks.load --scenario long_conversation --context-cache
+"""
+import argparse
+import asyncio
+import logging
+import random
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import aiohttp
+import numpy as np
+import uvicorn
+
+import routers.places
+import utils.context_cache
+import utils.conversation
+import utils.llm
+import utils.maps
+from benchmarks.fakes import FakeGenAIClient, FakeMapsServer, Latency
+from server import app
+from utils.cache import MemoryCache
+from utils.constants import (
+    MAPS_CACHE_TTL_SECONDS,
+    MAPS_CACHE_MAX_ENTRIES,
+    SCORE_CACHE_TTL_SECONDS,
+    SCORE_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_TTL_SECONDS,
+    SUMMARY_CACHE_MAX_ENTRIES,
+    CONTEXT_CACHE_TTL_SECONDS,
+    CONTEXT_CACHE_MAX_ENTRIES,
+    SESSION_TTL_SECONDS,
+    SESSION_MAX_ENTRIES,
+)
+from utils.llm import LLMScheduler
+from utils.maps import maps_client
+from utils.place_store import PlaceStore
+
+# Center of the simulated groups, matching the fixtures
+CITY_CENTER = (40.73, -73.99)
+GROUP_SPREAD_DEGREES = 0.05
+
+USER_MESSAGES = [
+    "We want to grab dinner tonight, somewhere with pizza.",
+    "Ideally not too far for anyone, we are coming from different parts of town.",
+    "One of us has a dog, so dog friendly would be great.",
+    "Budget is moderate, nothing too fancy.",
+    "Outdoor seating would be nice if the weather holds.",
+    "We are a group, so a place that takes reservations is a plus.",
+]
+
+# User messages that name a place type, which speculative Maps searches can guess
+NAMED_PLACE_MESSAGES = [
+    "Let's get pizza tonight, somewhere lively.",
+    "How about brunch on Sunday?",
+    "A wine bar would be nice after work.",
+    "Somewhere italian, we love pasta.",
+    "Let's meet at a cafe first.",
+]
+
+
+@dataclass
+class Scenario:
+    """A load-test scenario."""
+    name: str
+    concurrency: int
+    requests: int
+    group_size: int = 2
+    conversation_length: int = 2
+    body: dict = field(default_factory=dict)  # Extra `ChatRequest` fields
+    user_messages: List[str] = field(default_factory=lambda: USER_MESSAGES)
+    turns: int = 1  # Chat turns per conversation, each adding a user message
+    duplicates: int = 1  # Identical chats sent at once per conversation
+
+
+SCENARIOS = [
+    Scenario("single", concurrency=1, requests=10),
+    Scenario("concurrent", concurrency=16, requests=64, group_size=3, conversation_length=4),
+    Scenario("large_group", concurrency=8, requests=32, group_size=12, conversation_length=4),
+    Scenario("long_conversation", concurrency=8, requests=32, group_size=3, conversation_length=40),
+    Scenario("progressive_delta", concurrency=16, requests=64, group_size=3, conversation_length=4,
+             body={"progressive": True, "streamMode": "delta"}),
+    Scenario("named_places", concurrency=1, requests=10, conversation_length=1,
+             user_messages=NAMED_PLACE_MESSAGES),
+    Scenario("follow_up", concurrency=8, requests=16, group_size=3, conversation_length=4, turns=3),
+    Scenario("group_burst", concurrency=16, requests=16, group_size=4, conversation_length=4, duplicates=4),
+]
+
+
+@dataclass
+class Result:
+    """Timings of one chat, in seconds."""
+    latency: float
+    first_event: Optional[float]
+    ok: bool
+
+
+def chat_body(scenario: Scenario, rng: random.Random) -> dict:
+    """Build a random chat request for a scenario."""
+    users = [
+        {
+            "name": f"user{i}",
+            "location": {
+                "latitude": CITY_CENTER[0] + rng.uniform(-GROUP_SPREAD_DEGREES, GROUP_SPREAD_DEGREES),
+                "longitude": CITY_CENTER[1] + rng.uniform(-GROUP_SPREAD_DEGREES, GROUP_SPREAD_DEGREES),
+            },
+        }
+        for i in range(scenario.group_size)
+    ]
+    messages = [
+        {
+            "role": "user" if i % 2 == 0 else "model",
+            "content": rng.choice(scenario.user_messages) if i % 2 == 0 else "Noted, anything else?",
+        }
+        for i in range(scenario.conversation_length)
+    ]
+    body = {"messages": messages, "userLocations": users, **scenario.body}
+    if scenario.turns > 1:
+        body["conversationId"] = f"{rng.getrandbits(64):x}"
+    return body
+
+
+def follow_up_body(body: dict, rng: random.Random, scenario: Scenario) -> dict:
+    """Add a model answer and a new user message to a chat body."""
+    messages = body["messages"] + [
+        {"role": "model", "content": "Noted, anything else?"},
+        {"role": "user", "content": rng.choice(scenario.user_messages)},
+    ]
+    return {**body, "messages": messages}
+
+
+async def run_chat(session: aiohttp.ClientSession, url: str, body: dict) -> Result:
+    """Send one chat and time the stream."""
+    start = time.perf_counter()
+    first_event = None
+    ok = True
+    async with session.post(url, json=body) as response:
+        ok = response.status == 200
+        async for line in response.content:
+            if line.startswith(b"event:"):
+                if first_event is None:
+                    first_event = time.perf_counter() - start
+                if line.startswith(b"event: error"):
+                    ok = False
+    return Result(time.perf_counter() - start, first_event, ok)
+
+
+def reset_caches() -> None:
+    """Swap in empty in-memory caches for the Maps search, the scores, the summaries,
+    the registered prompt prefixes, the sessions and the place store."""
+    utils.maps.search_cache = MemoryCache(ttl=MAPS_CACHE_TTL_SECONDS, max_entries=MAPS_CACHE_MAX_ENTRIES)
+    utils.maps.place_store = PlaceStore()
+    routers.places.score_cache = MemoryCache(ttl=SCORE_CACHE_TTL_SECONDS, max_entries=SCORE_CACHE_MAX_ENTRIES)
+    utils.conversation.summary_cache = MemoryCache(
+        ttl=SUMMARY_CACHE_TTL_SECONDS, max_entries=SUMMARY_CACHE_MAX_ENTRIES
+    )
+    utils.context_cache.prefix_names = MemoryCache(
+        ttl=CONTEXT_CACHE_TTL_SECONDS, max_entries=CONTEXT_CACHE_MAX_ENTRIES
+    )
+    routers.places.session_store = MemoryCache(ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES)
+
+
+async def run_scenario(
+    scenario: Scenario,
+    url: str,
+    maps: FakeMapsServer,
+    llm: FakeGenAIClient,
+    seed: int,
+) -> dict:
+    """Run a scenario and summarize it."""
+    rng = random.Random(seed)
+    bodies = [chat_body(scenario, rng) for _ in range(scenario.requests)]
+    semaphore = asyncio.Semaphore(scenario.concurrency)
+    maps_calls, llm_calls, prompt_chars = maps.calls, llm.calls, llm.prompt_chars
+    maps_bytes = maps.bytes_sent
+
+    async def limited(session: aiohttp.ClientSession, body: dict) -> List[Result]:
+        results = []
+        async with semaphore:
+            for turn in range(scenario.turns):
+                if turn:
+                    body = follow_up_body(body, rng, scenario)
+                results.append(await run_chat(session, url, body))
+        return results
+
+    connector = aiohttp.TCPConnector(limit=scenario.concurrency)
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        conversations = await asyncio.gather(
+            *[limited(session, body) for body in bodies for _ in range(scenario.duplicates)]
+        )
+        elapsed = time.perf_counter() - start
+
+    results = [result for conversation in conversations for result in conversation]
+    chats = len(results)
+
+    latencies = np.array([result.latency for result in results])
+    first_events = np.array(
+        [result.first_event for result in results if result.first_event is not None]
+    )
+    return {
+        "scenario": scenario.name,
+        "requests": chats,
+        "failed": sum(not result.ok for result in results),
+        "throughput": chats / elapsed,
+        "p50": np.percentile(latencies, 50),
+        "p95": np.percentile(latencies, 95),
+        "p99": np.percentile(latencies, 99),
+        "ttfe_p50": np.percentile(first_events, 50) if len(first_events) else float("nan"),
+        "ttfe_p95": np.percentile(first_events, 95) if len(first_events) else float("nan"),
+        "llm_calls": (llm.calls - llm_calls) / chats,
+        "maps_calls": (maps.calls - maps_calls) / chats,
+        "maps_kbytes": (maps.bytes_sent - maps_bytes) / chats / 1000,
+        "prompt_kchars": (llm.prompt_chars - prompt_chars) / chats / 1000,
+    }
+
+
+def print_report(rows: List[dict]) -> None:
+    """Print the scenario summaries as a table, times in milliseconds."""
+    header = (
+        f"{'scenario':<20}{'reqs':>6}{'fail':>6}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+        f"{'ttfe50':>8}{'ttfe95':>8}{'llm/req':>9}{'maps/req':>10}{'kB/req':>8}"
+        f"{'kchar/req':>11}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['scenario']:<20}{row['requests']:>6}{row['failed']:>6}{row['throughput']:>8.1f}"
+            f"{row['p50'] * 1000:>8.0f}{row['p95'] * 1000:>8.0f}{row['p99'] * 1000:>8.0f}"
+            f"{row['ttfe_p50'] * 1000:>8.0f}{row['ttfe_p95'] * 1000:>8.0f}"
+            f"{row['llm_calls']:>9.1f}{row['maps_calls']:>10.1f}"
+            f"{row['maps_kbytes']:>8.1f}{row['prompt_kchars']:>11.1f}"
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    maps = FakeMapsServer(
+        latency=Latency(args.maps_latency, args.jitter * args.maps_latency),
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    llm = FakeGenAIClient(
+        latency=Latency(args.llm_latency, args.jitter * args.llm_latency),
+        stream_latency=Latency(args.stream_latency, args.jitter * args.stream_latency),
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    maps_client.base_url = await maps.start()
+    # The app warms up the default scheduler's client at startup
+    utils.llm.scheduler.client = llm
+    if args.context_cache:
+        utils.context_cache.CONTEXT_CACHE_MODE = "explicit"
+        utils.context_cache.CONTEXT_CACHE_MIN_TOKENS = 0
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    serving = asyncio.create_task(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    scenarios = [s for s in SCENARIOS if args.scenario in (None, s.name)]
+    rows = []
+    retries = 0
+    try:
+        for scenario in scenarios:
+            if not args.warm:
+                reset_caches()
+            routers.places.scheduler = utils.conversation.scheduler = LLMScheduler(llm)
+            rows.append(
+                await run_scenario(scenario, f"http://127.0.0.1:{port}/places/chat", maps, llm, args.seed)
+            )
+            retries += routers.places.scheduler.retries
+    finally:
+        server.should_exit = True
+        await serving
+        await maps.stop()
+
+    print_report(rows)
+    print(f"\nLLM retries: {retries}, fake LLM errors: {llm.errors}, fake Maps errors: {maps.errors}")
+    if args.context_cache:
+        print(f"Registered prompt prefixes: {llm.aio.caches.creates}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=[s.name for s in SCENARIOS], help="Run only this scenario")
+    parser.add_argument("--maps-latency", type=float, default=0.15, help="Mean Maps latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Mean LLM call latency in seconds")
+    parser.add_argument("--stream-latency", type=float, default=0.05, help="Mean delay between streamed chunks")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Latency jitter, as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of failed fake calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="Keep caches across scenarios")
+    parser.add_argument("--context-cache", action="store_true", help="Register shared scoring prefixes")
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main(parser.parse_args()))
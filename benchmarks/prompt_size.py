@@ -0,0 +1,133 @@
+"""Input size of the scoring and justification prompts, legacy vs compact.
+
+Renders the prompts of one chat over the searchText payloads in
+`benchmarks/fixtures` twice: with the Python reprs of the models the prompts
+used to get, and with the compact renderers of `utils.render`. Sizes are in
+estimated tokens (about 4 characters per token, as in
+`utils.llm.estimate_tokens`).
+
+The conversation row compares sending a long conversation to every per-place
+scoring call with summarizing it once (see `utils.conversation`). The summary
+size is an assumption (`--summary-chars`), as it depends on the model.
+
+Run from the repository root:
+    python -m benchmarks.prompt_size
+"""
+import argparse
+import json
+from pathlib import Path
+
+from benchmarks.parse_places import scoring_view
+from models.chat import Message
+from models.place import PlaceRanking, UserPreferences
+from utils.conversation import render_conversation
+from utils.maps import parse_place
+from utils.prompts import (
+    FINAL_SCORING_PROMPT,
+    JUSTIFICATION_PROMPT,
+    SCORING_PLACE_PROMPT,
+    SCORING_PREFIX_PROMPT,
+)
+from utils.render import render_final_scores, render_place, render_place_scores, render_places_table
+from utils.scoring import CRITERIA
+
+FIXTURES = Path(__file__).parent / "fixtures"
+QUERIES = ["pizza restaurants", "italian restaurants", "bars with live music"]
+# A whole per-place scoring prompt, the shared prefix and the place part together
+SCORING_PROMPT = SCORING_PREFIX_PROMPT + SCORING_PLACE_PROMPT
+
+CONVERSATION = [
+    "Dan: I'm up for pizza tonight, somewhere not too far from Union Square.",
+    "Maya: Pizza works, but I'd like a place with outdoor seating if the weather holds.",
+    "Sam: I'm bringing my dog, so it has to be dog friendly.",
+    "Dan: Budget-wise let's keep it moderate, nothing fancy.",
+    "Maya: Also I can't stay out late, ideally somewhere open before 6.",
+    "Sam: Good ratings matter to me, I don't want to gamble on a random spot.",
+]
+
+
+def estimate(text: str) -> int:
+    return len(text) // 4
+
+
+def load_places():
+    return [
+        parse_place(place)
+        for path in sorted(FIXTURES.glob("search_text_*.json"))
+        for place in json.loads(path.read_text())["places"]
+    ]
+
+
+def main(args: argparse.Namespace) -> None:
+    places = load_places()
+    history = "\n".join(CONVERSATION)
+    # Every criterion mentioned except a few, as a typical ranking
+    rankings = [
+        PlaceRanking(id=place.id, **{name: -1.0 if i % 3 == 0 else 0.7 for i, name in enumerate(CRITERIA)})
+        for place in places
+    ]
+    preferences = [UserPreferences(place_id=place.id, score=0.5) for place in places]
+
+    rows = []
+
+    legacy = sum(
+        estimate(SCORING_PROMPT.format(conversation_history=history, place_details=scoring_view(place)))
+        for place in places
+    )
+    compact = sum(
+        estimate(SCORING_PROMPT.format(conversation_history=history, place_details=render_place(place)))
+        for place in places
+    )
+    rows.append((f"scoring ({len(places)} calls)", legacy, compact))
+
+    legacy = sum(
+        estimate(FINAL_SCORING_PROMPT.format(
+            conversation_history=history, place_details=scoring_view(place), place_scores=ranking
+        ))
+        for place, ranking in zip(places, rankings)
+    )
+    compact = sum(
+        estimate(FINAL_SCORING_PROMPT.format(
+            conversation_history=history,
+            place_details=render_place(place),
+            place_scores=render_place_scores(ranking),
+        ))
+        for place, ranking in zip(places, rankings)
+    )
+    rows.append((f"final scoring ({len(places)} calls)", legacy, compact))
+
+    legacy = estimate(JUSTIFICATION_PROMPT.format(
+        conversation_history=history, search_queries=QUERIES, places=places, final_scores=preferences
+    ))
+    compact = estimate(JUSTIFICATION_PROMPT.format(
+        conversation_history=history,
+        search_queries=", ".join(QUERIES),
+        places=render_places_table(places),
+        final_scores=render_final_scores(preferences),
+    ))
+    rows.append(("justification", legacy, compact))
+
+    messages = [
+        Message(role="user", content=CONVERSATION[i % len(CONVERSATION)])
+        for i in range(args.conversation_length)
+    ]
+    long_history = estimate(render_conversation(messages))
+    summary = args.summary_chars // 4
+    rows.append((
+        f"conversation x{len(places)} calls",
+        long_history * len(places),
+        long_history + summary * len(places),
+    ))
+
+    print(f"{'prompt':<32}{'legacy':>10}{'compact':>10}{'saved':>8}")
+    print("-" * 60)
+    for name, legacy, compact in rows:
+        print(f"{name:<32}{legacy:>10}{compact:>10}{1 - compact / legacy:>8.0%}")
+    print(f"\nConversation of {args.conversation_length} messages, summary assumed {args.summary_chars} chars.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--conversation-length", type=int, default=60, help="Messages in the long conversation")
+    parser.add_argument("--summary-chars", type=int, default=600, help="Assumed size of the summary")
+    main(parser.parse_args())
@@ -0,0 +1,83 @@
+"""Planning time and tour quality of `utils.routing`.
+
+For groups and itineraries of several sizes, around random points in a
+city-sized area, times the travel matrix (cold and from the cache) and the
+pickup plus itinerary planning of `routers.routes.plan_routes`, and compares
+the itinerary travel time with nearest neighbour alone and, for small
+itineraries, with the optimum found by brute force.
+
+Run from the repository root:
+    python -m benchmarks.routes
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from models.chat import Location
+from models.route import TravelMode
+from routers.routes import plan_routes
+from utils.routing import nearest_neighbor, path_cost, travel_matrix
+
+CITY_CENTER = (40.73, -73.99)
+SPREAD_DEGREES = 0.08
+SIZES = [(2, 5), (4, 8), (8, 10), (12, 20), (20, 50), (30, 200)]
+BRUTE_FORCE_MAX_PLACES = 9
+
+
+def random_locations(rng: random.Random, n: int):
+    return [
+        Location(
+            latitude=CITY_CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+            longitude=CITY_CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES),
+        )
+        for _ in range(n)
+    ]
+
+
+def brute_force(cost, start, nodes) -> float:
+    return min(path_cost(cost, [start, *order]) for order in itertools.permutations(nodes))
+
+
+async def main(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    print(
+        f"{'users':>6}{'places':>8}{'matrix ms':>11}{'cached ms':>11}{'plan ms':>9}"
+        f"{'vs NN':>8}{'vs best':>9}"
+    )
+    for users, places in SIZES:
+        matrix_ms = cached_ms = plan_ms = nn_gain = 0.0
+        optimum_gaps = []
+        for _ in range(args.repeats):
+            locations = random_locations(rng, users + places)
+            start = time.perf_counter()
+            _, durations = await travel_matrix(locations, TravelMode.DRIVE)
+            matrix_ms += (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            await travel_matrix(list(reversed(locations)), TravelMode.DRIVE)
+            cached_ms += (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            _, itinerary = plan_routes(durations, users, places, driver=0, round_trip=False)
+            plan_ms += (time.perf_counter() - start) * 1000
+
+            nodes = list(range(users + 1, users + places))
+            planned = path_cost(durations, itinerary)
+            nn_gain += 1 - planned / path_cost(durations, nearest_neighbor(durations, users, nodes))
+            if places <= BRUTE_FORCE_MAX_PLACES:
+                optimum_gaps.append(planned / brute_force(durations, users, nodes) - 1)
+
+        gap = f"{sum(optimum_gaps) / len(optimum_gaps):>9.1%}" if optimum_gaps else f"{'-':>9}"
+        print(
+            f"{users:>6}{places:>8}{matrix_ms / args.repeats:>11.2f}{cached_ms / args.repeats:>11.2f}"
+            f"{plan_ms / args.repeats:>9.2f}{nn_gain / args.repeats:>8.1%}{gap}"
+        )
+    print("\n'vs NN': itinerary time saved over nearest neighbour; 'vs best': excess over the optimum.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,7 @@
 """ Chat request data structures. """
-from typing import List
-from pydantic import BaseModel
+from typing import List, Optional
+from enum import Enum
+from pydantic import BaseModel, Field
 
 class Message(BaseModel):
     """ Message data structure. """
@@ -16,7 +17,25 @@ class User(BaseModel):
     name: str
     location: Location
 
+class StreamMode(str, Enum):
+    """ Streaming protocol of the chat response """
+    SNAPSHOT = "snapshot" # Every `response` event carries the whole payload
+    DELTA = "delta" # Places are sent once, then `justification_delta` events
+
 class ChatRequest(BaseModel):
     """ Chat request data structure. """
     messages: List[Message]
     userLocations: List[User]
+    streamMode: StreamMode = StreamMode.SNAPSHOT
+    sendDone: bool = False # In delta mode, end with a `done` event carrying the full justification
+    timing: bool = False # End the stream with a `timing` event carrying per-stage timings and counters
+    progressive: bool = False # Send `place_scored` events as places are scored, then a `ranking` event
+    topK: Optional[int] = Field(default=None, ge=1) # Candidates sent to LLM scoring, defaults to PREFILTER_TOP_K
+    requirements: List[str] = [] # Availability fields that must not be FALSE, e.g. "allowedDogs"
+    previousQueries: List[str] = [] # Search queries of the previous turn, prefetched while the new ones are generated
+    conversationId: Optional[str] = None # Keeps the ranking between turns so follow-ups only re-rank what changed
+
+class BatchChatRequest(BaseModel):
+    """ Batch of group chats planned in one call """
+    requests: List[ChatRequest] = Field(min_length=1)
+    justification: bool = True # Write the justification of every chat, one LLM call each
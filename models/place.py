@@ -66,6 +66,14 @@ class PlaceRanking(BaseModel):
     priceLevel: float = Field(ge=-1, le=1.0)
     priceRange: float = Field(ge=-1, le=1.0)
 
+class PlaceBatchScore(PlaceRanking):
+    """ Ranking scores and final score for a place scored in a batch """
+    score: float = Field(ge=-1, le=1.0)
+
+class AffectedCriteria(BaseModel):
+    """ Criteria whose scores new messages of a conversation may change """
+    criteria: List[str] = []
+
 class UserPreferences(BaseModel):
     """ User Preferences for a place """
     place_id: str
@@ -77,6 +85,9 @@ class SearchRequest(BaseModel):
     messages: List[Message]
     location: Location
     searchRadius: int
+    topK: Optional[int] = None
+    requirements: List[str] = []
+    userLocations: List[Location] = [] # Used for the distance and fairness of each place
 
 class SearchQueries(BaseModel):
     """ Search queries data structure. """
@@ -88,3 +99,13 @@ class SearchResponse(BaseModel):
     places: List[PlaceFullResponse]
     justification: str
     user_preferences: List[UserPreferences]
+
+
+class Session(BaseModel):
+    """ Ranking state of a conversation, kept between chat turns """
+    messages: List[Message] # Messages the ranking reflects
+    queries: List[str] # Every query searched so far
+    location: Location
+    searchRadius: int
+    places: List[PlaceFullResponse] # Running top places, best first
+    rankings: List[PlaceRanking] # Criteria scores of `places`, in the same order
@@ -0,0 +1,46 @@
+""" Route planning data structures. """
+from typing import List, Optional
+from enum import Enum
+from pydantic import BaseModel
+from models.chat import Location, User
+from models.place import PlaceFullResponse
+
+class TravelMode(str, Enum):
+    """ How the group travels between stops """
+    DRIVE = "drive"
+    BICYCLE = "bicycle"
+    WALK = "walk"
+
+class StopKind(str, Enum):
+    """ What a stop of a route is """
+    USER = "user" # A user picked up on the way
+    PLACE = "place" # A place of the itinerary
+
+class RouteRequest(BaseModel):
+    """ Route planning request data structure. """
+    userLocations: List[User]
+    places: List[PlaceFullResponse] # Top-ranked places, best first. The itinerary starts at the first one
+    mode: TravelMode = TravelMode.DRIVE
+    driver: Optional[str] = None # Name of the user picking up the others, defaults to the first user
+    roundTrip: bool = False # End the itinerary back at its first place
+
+class RouteStop(BaseModel):
+    """ A stop of a planned route """
+    id: str # User name or place id
+    kind: StopKind
+    name: str
+    location: Location
+    arrivalSeconds: float # Travel time from the start of the route
+    distanceMeters: float # Travel distance from the start of the route
+
+class RoutePlan(BaseModel):
+    """ An ordered route with its totals """
+    stops: List[RouteStop]
+    distanceMeters: float
+    durationSeconds: float
+
+class RouteResponse(BaseModel):
+    """ Route planning response data structure. """
+    pickup: RoutePlan # From the driver through every other user to the first place
+    itinerary: RoutePlan # Through every place, starting at the first one
+    mode: TravelMode
@@ -0,0 +1,31 @@
+"""Router for the liveness and readiness probes."""
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from utils.warmup import warmup
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz() -> dict:
+    """Liveness probe: the process is up and serving requests.
+
+    Returns:
+        `{"status": "ok"}`.
+    """
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Readiness probe: the shared clients are warm (see `utils.warmup`).
+
+    Returns:
+        200 with `"status": "ready"` once the warm-up has finished, 503 with
+        `"status": "warming"` before, and the outcome per client.
+    """
+    if not warmup.ready:
+        return JSONResponse({"status": "warming", "clients": warmup.results}, status_code=503)
+    return JSONResponse({"status": "ready", "clients": warmup.results})
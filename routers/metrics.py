@@ -0,0 +1,18 @@
+"""Router for the Prometheus metrics endpoint."""
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import render_metrics
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Expose the process metrics in the Prometheus text format.
+
+    Returns:
+        The stage timings, request counts and call, cache and token counters.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
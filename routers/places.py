@@ -1,55 +1,167 @@
 """Router for the places API."""
 
 import json
+import time
 import asyncio
-from typing import List
+import logging
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
-import requests
-from google import genai
 from google.genai import types
 
-from utils.constants import MAPS_API_URL, GOOGLE_API_KEY, LITE_MODEL
+from utils.constants import (
+    LITE_MODEL,
+    SCORING_MODE,
+    SCORING_BATCH_SIZE,
+    FINAL_SCORING_MODE,
+    SPECULATIVE_PREFETCH,
+    SESSION_TOP_K,
+    BATCH_MAX_REQUESTS,
+    BATCH_MAX_CONCURRENCY,
+)
+from utils.aio import iter_completed
+from utils.geo import search_area
+from utils.llm import Priority, scheduler
+from utils.log import PAYLOAD_LOGGER
+from utils.maps import search_places_many
+from utils.metrics import count, in_stage, observe, span, start_trace
+from utils.prefetch import Prefetch, speculative_queries
+from utils.prefilter import is_eligible, prefilter_places
+from utils.context_cache import SharedPrefix
+from utils.conversation import render_conversation, scoring_conversation
+from utils.render import (
+    render_final_scores,
+    render_place,
+    render_place_scores,
+    render_places_table,
+)
+from utils.session import build_session, is_follow_up, new_queries, session_store
+from utils.scoring import (
+    CRITERIA,
+    final_scores,
+    location_scores,
+    partial_ranking_model,
+    score_cache,
+    score_cache_key,
+    score_flight,
+    conversation_fingerprint,
+    history_fingerprint,
+)
 from utils.prompts import (
     CREATE_QUERY_PROMPT,
     JUSTIFICATION_PROMPT,
-    SCORING_PROMPT,
+    SCORING_PREFIX_PROMPT,
+    SCORING_PLACE_PROMPT,
     FINAL_SCORING_PROMPT,
+    BATCH_SCORING_PROMPT,
+    AFFECTED_CRITERIA_PROMPT,
+    RESCORING_PROMPT,
 )
 from models.place import (
+    AffectedCriteria,
     PlaceFullResponse,
-    Place,
     PlaceRanking,
+    PlaceBatchScore,
     SearchRequest,
     Location,
     SearchResponse,
-    Availability,
     UserPreferences,
-    PriceRange,
     SearchQueries,
+    Session,
 )
-from models.chat import ChatRequest, Message
+from models.chat import BatchChatRequest, ChatRequest, Message, StreamMode
 
 router = APIRouter(prefix="/places")
+logger = logging.getLogger(__name__)
+payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+
+
+def format_event(event: str, data: dict) -> str:
+    """Format a server-sent event frame.
+
+    Args:
+        event: The event name.
+        data: The JSON-serializable event payload.
+
+    Returns:
+        The SSE frame.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-client = genai.Client(api_key=GOOGLE_API_KEY)
 
+async def timed_stream(chunks: AsyncIterator, stage: str) -> AsyncIterator:
+    """Pass a stream through, recording the time spent waiting for its chunks
+    as `stage` and the time to its first chunk as `<stage>_ttft`.
 
-def map_to_availability(value):
-    """Map a value to an availability enum.
+    The time the consumer takes between chunks, e.g. to send them to the
+    client, is not part of the stage.
 
     Args:
-        value: The value to map.
+        chunks: The stream.
+        stage: The stage name.
+
+    Yields:
+        The chunks of `chunks`.
+    """
+    start = time.perf_counter()
+    waited = 0.0
+    first = True
+    try:
+        async with aclosing(chunks):
+            while True:
+                resumed = time.perf_counter()
+                try:
+                    with in_stage(stage):
+                        chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    break
+                finally:
+                    waited += time.perf_counter() - resumed
+                if first:
+                    observe(f"{stage}_ttft", time.perf_counter() - start)
+                    first = False
+                yield chunk
+    finally:
+        observe(stage, waited)
+
+
+async def generate_search_queries(messages: List[Message]) -> SearchQueries:
+    """Generate the Maps search queries for the conversation.
+
+    Args:
+        messages: The conversation history.
 
     Returns:
-        The mapped availability.
+        The generated search queries.
     """
-    if value is True or value == "TRUE" or value == "true":
-        return Availability.TRUE
-    elif value is False or value == "FALSE" or value == "false":
-        return Availability.FALSE
-    else:
-        return Availability.NOT_AVAILABLE
+    formatted_messages = [
+        types.Content(
+            role=message.role, parts=[types.Part.from_text(text=message.content)]
+        )
+        for message in messages
+    ]
+
+    with span("queries"):
+        queries_pv = await scheduler.generate_content(
+            priority=Priority.NORMAL,
+            model=LITE_MODEL,
+            contents=formatted_messages,
+            config=types.GenerateContentConfig(
+                system_instruction=CREATE_QUERY_PROMPT.format(
+                    conversation_history="\n".join(
+                        [message.content for message in messages]
+                    )
+                ),
+                response_mime_type="application/json",
+                response_schema=SearchQueries,
+            ),
+        )
+
+    if not queries_pv.parsed:
+        raise HTTPException(status_code=500, detail="Failed to parse search queries")
+
+    return queries_pv.parsed
 
 
 @router.post("/chat", response_model=SearchResponse)
@@ -60,228 +172,379 @@ async def find_places(request: ChatRequest) -> StreamingResponse:
         request (ChatRequest): The chat request.
 
     Returns:
-        A streaming response containing places and justification.
+        A streaming response with a `queries` event and a `places` event. In
+        progressive mode, the `places` event is replaced by one `place_scored`
+        event per place as soon as it is scored and a final `ranking` event
+        with the user preferences by descending score. In snapshot mode, `response` events then carry the places together with
+        the justification so far. In delta mode, `justification_delta` events
+        carry only the new text, optionally followed by a `done` event. With
+        `timing`, a final `timing` event carries the per-stage timings and
+        counters of the request (see `utils.metrics`). With a `conversationId`,
+        the ranking is kept for the next turn, which then only re-ranks what
+        its new messages change (see `rerank_follow_up`).
     """
     messages = request.messages
+    # Sizes and modes only: messages and user locations are personal data
+    payload_logger.info(
+        "Chat request: %d messages, %d users, stream=%s progressive=%s timing=%s sendDone=%s topK=%s "
+        "requirements=%s follow-up=%s",
+        len(messages),
+        len(request.userLocations),
+        request.streamMode.value,
+        request.progressive,
+        request.timing,
+        request.sendDone,
+        request.topK,
+        request.requirements,
+        request.conversationId is not None,
+    )
 
     locations = [
         Location(latitude=userLocation.location.latitude, longitude=userLocation.location.longitude)
         for userLocation in request.userLocations
     ]
 
-    #The ideal location is something such that no one needs to travel more than 2 hours
-    # to get to the place. This is a rough estimate and can be improved.
-    ideal_location = Location(
-        latitude=sum([location.latitude for location in locations]) / len(locations),
-        longitude=sum([location.longitude for location in locations]) / len(locations),
-    )
+    if not locations:
+        raise HTTPException(status_code=400, detail="At least one user location is required")
 
-    # For now, just a dummy search radius of 10 km
-    search_radius = 50000  # 10 km
-
-
-    formatted_messages = [
-        types.Content(
-            role=message.role, parts=[types.Part.from_text(text=message.content)]
-        )
-        for message in messages
-    ]
+    # Search around the spherical centroid of the users, with a radius that
+    # grows with how spread out they are (see `utils.geo.search_area`).
+    ideal_location, search_radius = search_area(locations)
+    trace = start_trace()
 
-    queries_pv = client.models.generate_content(
-        model=LITE_MODEL,
-        contents=formatted_messages,
-        config=types.GenerateContentConfig(
-            system_instruction=CREATE_QUERY_PROMPT.format(
-                conversation_history="\n".join(
-                    [message.content for message in messages]
-                )
-            ),
-            response_mime_type="application/json",
-            response_schema=SearchQueries,
-        ),
+    # Search Maps for guessed queries while the real ones are generated
+    prefetch = Prefetch(
+        speculative_queries(messages, request.previousQueries) if SPECULATIVE_PREFETCH else [],
+        ideal_location,
+        search_radius,
     )
 
-    if not queries_pv.parsed:
-        raise HTTPException(status_code=500, detail="Failed to parse search queries")
-
-    queries = queries_pv.parsed
-
-    print(queries)
+    async def generate_events():
+        # Generate the search queries inside the stream so the response starts
+        # right away and the event loop is never blocked on the LLM call.
+        try:
+            queries = await generate_search_queries(messages)
+        except HTTPException as e:
+            yield format_event("error", {"detail": e.detail})
+            return
+
+        payload_logger.info("Search queries: %s", queries)
+        yield format_event("queries", {"queries": queries.queries})
+
+        search_request = SearchRequest(
+            queries=queries.queries,
+            messages=messages,
+            location=ideal_location,
+            searchRadius=search_radius,
+            topK=request.topK,
+            requirements=request.requirements,
+            userLocations=locations,
+        )
+        # A follow-up turn of a known conversation only re-ranks what changed
+        session = None
+        if request.conversationId:
+            session = await session_store.aget(request.conversationId)
+            if session is not None and not is_follow_up(session, messages, ideal_location, search_radius):
+                session = None
+        # A follow-up only searches the queries its session has not, so the
+        # guessed searches of the others are cancelled rather than left running
+        prefetched = prefetch.take(
+            queries.queries if session is None else new_queries(session, queries.queries)
+        )
+        rankings: Dict[str, PlaceRanking] = {}
 
-    async def generate_response():
         response_builder = {}
-        # First get and stream the places
-        places = await get_places_from_maps(
-            SearchRequest(queries=queries.queries, messages=messages, location=ideal_location, searchRadius=search_radius)
-        )
+        # Then get and stream the places
+        try:
+            if request.progressive and session is not None:
+                # Re-ranking needs every score, so the places are sent together
+                places = await rerank_follow_up(session, search_request, prefetched, rankings)
+                for place, user_preference in zip(places.places, places.user_preferences):
+                    yield format_event("place_scored", {
+                        "place": place.model_dump(),
+                        "user_preference": user_preference.model_dump(),
+                    })
+            elif request.progressive:
+                # Send every place as soon as it is scored, then the final order
+                candidates = await search_candidates(search_request, prefetched)
+                candidates_by_id = {place.id: place for place in candidates}
+                fairness = location_scores(candidates, locations, search_radius)
+                user_preferences = []
+                # Only the scoring is timed, not the sending of the events
+                async with aclosing(timed_stream(
+                    iter_user_preferences(messages, candidates, fairness, rankings), "scoring"
+                )) as scored:
+                    async for user_preference in scored:
+                        user_preferences.append(user_preference)
+                        yield format_event("place_scored", {
+                            "place": candidates_by_id[user_preference.place_id].model_dump(),
+                            "user_preference": user_preference.model_dump(),
+                        })
+                user_preferences.sort(key=lambda user_preference: user_preference.score, reverse=True)
+                places = SearchResponse(
+                    places=[candidates_by_id[user_preference.place_id] for user_preference in user_preferences],
+                    justification="",
+                    user_preferences=user_preferences,
+                )
+            elif session is not None:
+                places = await rerank_follow_up(session, search_request, prefetched, rankings)
+            else:
+                places = await get_places_from_maps(search_request, prefetched, rankings)
+        except HTTPException as e:
+            yield format_event("error", {"detail": e.detail})
+            return
+        if request.progressive:
+            yield format_event("ranking", {
+                "user_preferences": [user_preference.model_dump() for user_preference in places.user_preferences]
+            })
+
+        if request.conversationId:
+            await session_store.aset(request.conversationId, build_session(
+                messages,
+                queries.queries,
+                ideal_location,
+                search_radius,
+                places.places,
+                places.user_preferences,
+                rankings,
+                previous=session,
+            ))
         response_builder["places"] = [place.model_dump() for place in places.places]
         response_builder["user_preferences"] = [
             user_preference.model_dump() for user_preference in places.user_preferences
         ]
         response_builder["justification"] = ""
-        yield f"event: places\ndata: {json.dumps(response_builder)}\n\n"
+        if not request.progressive:
+            yield format_event("places", response_builder)
 
         # Then stream the justification
-        async for chunk in await client.aio.models.generate_content_stream(
+        chunks = timed_stream(scheduler.generate_content_stream(
+            priority=Priority.HIGH,
             model=LITE_MODEL,
             contents=JUSTIFICATION_PROMPT.format(
-                conversation_history="\n".join(
-                    [message.content for message in messages]
-                ),
-                search_queries=queries.queries,
-                places=places.places,
-                final_scores=places.user_preferences,
+                conversation_history=render_conversation(messages),
+                search_queries=", ".join(queries.queries),
+                places=render_places_table(places.places),
+                final_scores=render_final_scores(places.user_preferences),
             ),
-        ):
-            response_builder["justification"] += chunk.text
-            yield f"event: response\ndata: {json.dumps(response_builder)}\n\n"
+        ), "justification")
+
+        if request.streamMode == StreamMode.DELTA:
+            justification = []
+            async for chunk in chunks:
+                if chunk.text:
+                    justification.append(chunk.text)
+                    yield format_event("justification_delta", {"delta": chunk.text})
+            if request.sendDone:
+                yield format_event("done", {"justification": "".join(justification)})
+            return
+
+        # Snapshot mode: the places part of the payload is serialized once and
+        # only the justification is re-encoded for every chunk.
+        del response_builder["justification"]
+        snapshot_head = json.dumps(response_builder)[:-1] + ', "justification": '
+        justification = ""
+        async for chunk in chunks:
+            justification += chunk.text or ""
+            yield f"event: response\ndata: {snapshot_head}{json.dumps(justification)}}}\n\n"
 
-    return StreamingResponse(generate_response(), media_type="text/event-stream")
+    async def generate_response():
+        try:
+            async with aclosing(generate_events()) as events:
+                async for event in events:
+                    yield event
+        finally:
+            prefetch.cancel()
+            observe("total", time.perf_counter() - trace.started)
+        if request.timing:
+            yield format_event("timing", trace.summary())
+
+    return StreamingResponse(
+        generate_response(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
-async def get_places_from_maps(request: SearchRequest) -> SearchResponse:
-    """Get places from the maps API.
+@router.post("/chat:batch")
+async def find_places_batch(request: BatchChatRequest) -> StreamingResponse:
+    """Plan many group chats in one call, e.g. to precompute suggestions.
+
+    Chats go through the same pipeline as `/chat`, at most
+    `BATCH_MAX_CONCURRENCY` at a time, and share its work across the batch:
+    chats with the same conversation generate their search queries once, and
+    Maps searches and place scoring are deduplicated across
+    chats by their caches and single-flights (see `utils.singleflight`).
+    Justifications are written at low priority, like the scoring, so a batch
+    does not hold up interactive chats. Sessions are neither read nor kept.
+
+    Args:
+        request (BatchChatRequest): The chats.
 
     Returns:
-        The places from the maps API.
+        A streaming NDJSON response with one line per chat, in completion
+        order: its `index` in the batch with its `queries`, `places`,
+        `user_preferences` and `justification`, or its `index` and an `error`.
     """
-    locationBias = {
-        "circle": {
-            "center": {
-                "latitude": request.location.latitude,
-                "longitude": request.location.longitude,
-            },
-            "radius": request.searchRadius,
+    if len(request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {BATCH_MAX_REQUESTS} chats are supported per batch"
+        )
+    payload_logger.info("Batch chat request: %d chats", len(request.requests))
+    slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    # Query generations by conversation fingerprint, shared by the chats of the batch
+    query_tasks: Dict[str, asyncio.Task] = {}
+
+    async def get_search_queries(messages: List[Message]) -> SearchQueries:
+        key = conversation_fingerprint(messages)
+        task = query_tasks.get(key)
+        if task is None:
+            task = query_tasks[key] = asyncio.ensure_future(generate_search_queries(messages))
+        else:
+            count("batch_shared_queries")
+        return await asyncio.shield(task)
+
+    async def plan_chat(chat: ChatRequest) -> dict:
+        locations = [
+            Location(latitude=userLocation.location.latitude, longitude=userLocation.location.longitude)
+            for userLocation in chat.userLocations
+        ]
+        if not locations:
+            raise HTTPException(status_code=400, detail="At least one user location is required")
+        ideal_location, search_radius = search_area(locations)
+
+        queries = await get_search_queries(chat.messages)
+        places = await get_places_from_maps(SearchRequest(
+            queries=queries.queries,
+            messages=chat.messages,
+            location=ideal_location,
+            searchRadius=search_radius,
+            topK=chat.topK,
+            requirements=chat.requirements,
+            userLocations=locations,
+        ))
+
+        justification = places.justification
+        if request.justification and places.places:
+            with span("justification"):
+                justification_pv = await scheduler.generate_content(
+                    priority=Priority.LOW,
+                    model=LITE_MODEL,
+                    contents=JUSTIFICATION_PROMPT.format(
+                        conversation_history=render_conversation(chat.messages),
+                        search_queries=", ".join(queries.queries),
+                        places=render_places_table(places.places),
+                        final_scores=render_final_scores(places.user_preferences),
+                    ),
+                )
+            justification = justification_pv.text or ""
+
+        return {
+            "queries": queries.queries,
+            "places": [place.model_dump() for place in places.places],
+            "user_preferences": [
+                user_preference.model_dump() for user_preference in places.user_preferences
+            ],
+            "justification": justification,
         }
-    }
-    print(locationBias)
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "X-Goog-Api-Key": GOOGLE_API_KEY,
-        "X-Goog-FieldMask": "places.id,places.displayName,places.formattedAddress,places.websiteUri,places.googleMapsUri,places.types,places.currentOpeningHours,places.accessibilityOptions,places.businessStatus,places.goodForChildren,places.goodForGroups,places.liveMusic,places.allowsDogs,places.outdoorSeating,places.parkingOptions,places.dineIn,places.delivery,places.internationalPhoneNumber,places.photos,places.rating,places.userRatingCount,places.reservable,places.priceRange,places.priceLevel,places.location",
-    }
+    async def plan_line(index: int, chat: ChatRequest) -> str:
+        async with slots:
+            count("batch_chats")
+            try:
+                result = {"index": index, **await plan_chat(chat)}
+            except HTTPException as e:
+                result = {"index": index, "error": e.detail}
+            except Exception:
+                # One failed chat must not cancel the rest of the batch
+                logger.exception("Batch chat %d failed", index)
+                result = {"index": index, "error": "Internal error"}
+        return json.dumps(result) + "\n"
+
+    async def generate_lines():
+        try:
+            async with aclosing(iter_completed(
+                plan_line(index, chat) for index, chat in enumerate(request.requests)
+            )) as lines:
+                async for line in lines:
+                    yield line
+        finally:
+            for task in query_tasks.values():
+                task.cancel()
+
+    return StreamingResponse(generate_lines(), media_type="application/x-ndjson")
+
+
+async def search_candidates(
+    request: SearchRequest, prefetched: Optional[Dict[str, asyncio.Task]] = None
+) -> List[PlaceFullResponse]:
+    """Search the maps API for all queries, deduplicate the results and
+    pre-rank them (see `utils.prefilter`).
 
+    Args:
+        request: The search request.
+        prefetched: Speculative searches of the same area by normalized query
+            (see `utils.prefetch`), reused for the matching queries.
+
+    Returns:
+        The top-K eligible places, best heuristic score first.
+    """
     all_places = []
     seen_place_ids = set()
 
-    # Process each query separately
-    for query in request.queries:
-        body = {"textQuery": query, "locationBias": locationBias}
-        print(body)
-        response = requests.post(MAPS_API_URL+"?pageSize=10", headers=headers, json=body, timeout=1000)
-        data = response.json()
-
-        if "places" in data and data["places"]:
-            for place in data["places"]:
-                # Skip if we've already seen this place
-                if place["id"] in seen_place_ids:
-                    continue
-
-                seen_place_ids.add(place["id"])
-                all_places.append(
-                    PlaceFullResponse(
-                        id=place["id"],
-                        displayName=place["displayName"]["text"],
-                        formattedAddress=place["formattedAddress"] if "formattedAddress" in place else None,
-                        rating=place["rating"] if "rating" in place else None,
-                        googleMapsUri=place["googleMapsUri"],
-                        websiteUri=place["websiteUri"] if "websiteUri" in place else None,
-                        location=Location(
-                            latitude=place["location"]["latitude"],
-                            longitude=place["location"]["longitude"],
-                        ),
-                        userRatingCount=place["userRatingCount"],
-                        types=place["types"],
-                        currentOpeningHours=(
-                            place["currentOpeningHours"]["weekdayDescriptions"]
-                            if "currentOpeningHours" in place and "weekdayDescriptions" in place["currentOpeningHours"]
-                            else []
-                        ),
-                        goodForChildren=(
-                            map_to_availability(place["goodForChildren"])
-                            if "goodForChildren" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        goodForGroups=(
-                            map_to_availability(place["goodForGroups"])
-                            if "goodForGroups" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        liveMusic=(
-                            map_to_availability(place["liveMusic"])
-                            if "liveMusic" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        allowedDogs=(
-                            map_to_availability(place["allowedDogs"])
-                            if "allowedDogs" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        outdoorSeating=(
-                            map_to_availability(place["outdoorSeating"])
-                            if "outdoorSeating" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        parkingOptions=(
-                            map_to_availability(place["parkingOptions"])
-                            if "parkingOptions" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        dineIn=(
-                            map_to_availability(place["dineIn"])
-                            if "dineIn" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        delivery=(
-                            map_to_availability(place["delivery"])
-                            if "delivery" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        reservable=(
-                            map_to_availability(place["reservable"])
-                            if "reservable" in place
-                            else Availability.NOT_AVAILABLE
-                        ),
-                        priceRange=PriceRange(
-                            startPrice=(
-                                place["priceRange"]["startPrice"]["currencyCode"]
-                                + " "
-                                + place["priceRange"]["startPrice"]["units"]
-                                if "priceRange" in place and "startPrice" in place["priceRange"]
-                                else None
-                            ),
-                            endPrice=(
-                                place["priceRange"]["endPrice"]["currencyCode"]
-                                + " "
-                                + place["priceRange"]["endPrice"]["units"]
-                                if "priceRange" in place and "endPrice" in place["priceRange"]
-                                else None
-                            ),
-                        ),
-                        photos=(
-                            [photo["googleMapsUri"] for photo in place["photos"]]
-                            if "photos" in place
-                            else None
-                        ),
-                        internationalPhoneNumber=(
-                            place["internationalPhoneNumber"]
-                            if "internationalPhoneNumber" in place
-                            else None
-                        ),
-                        businessStatus=(
-                            place["businessStatus"] if "businessStatus" in place else None
-                        ),
-                    )
-                )
+    # Run all queries concurrently, reusing cached results where possible
+    with span("search"):
+        places_per_query = await search_places_many(
+            request.queries, request.location, request.searchRadius, prefetched=prefetched
+        )
+
+    for places in places_per_query:
+        for place in places:
+            # Skip if we've already seen this place
+            if place.id in seen_place_ids:
+                continue
+
+            seen_place_ids.add(place.id)
+            all_places.append(place)
+
+    # Only the most promising candidates go on to LLM scoring
+    with span("prefilter"):
+        return prefilter_places(
+            all_places,
+            request.location,
+            request.searchRadius,
+            request.queries,
+            requirements=request.requirements,
+            top_k=request.topK,
+            user_locations=request.userLocations,
+        )
+
+
+async def get_places_from_maps(
+    request: SearchRequest,
+    prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
+) -> SearchResponse:
+    """Get places from the maps API.
+
+    Args:
+        request: The search request.
+        prefetched: Speculative searches to reuse (see `search_candidates`).
+        rankings: If given, filled with the criteria scores by place id.
+
+    Returns:
+        The places from the maps API.
+    """
+    all_places = await search_candidates(request, prefetched)
 
     if not all_places:
         return SearchResponse(
             places=[], justification="No places found matching your queries.", user_preferences=[]
         )
 
-    user_preferences = await get_user_preferences(request.messages, all_places)
+    fairness = location_scores(all_places, request.userLocations, request.searchRadius)
+    with span("scoring"):
+        user_preferences = await get_user_preferences(request.messages, all_places, fairness, rankings)
 
     return SearchResponse(
         places=all_places, justification="", user_preferences=user_preferences
@@ -289,81 +552,137 @@ async def get_places_from_maps(request: SearchRequest) -> SearchResponse:
 
 
 async def get_user_preferences(
-    messages: List[Message], places: List[PlaceFullResponse]
+    messages: List[Message],
+    places: List[PlaceFullResponse],
+    fairness: Optional[Dict[str, float]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
 ) -> List[UserPreferences]:
     """Get the user preferences for the places.
-    For this we firstly get the place scores for various criteria based on the
-    conversation history and the place details (useful information from retrieved places).
-    Then we get the final score for each place based on the place scores
-    and the conversation history.
 
     Args:
         messages: The conversation history.
         places: The places to get the user preferences for.
+        fairness: Location scores by place id for local final scoring.
+        rankings: If given, filled with the criteria scores by place id.
 
     Returns:
-        The user preferences for the places.
+        The user preferences for the places, in the same order as `places`.
     """
+    preferences_by_id = {
+        user_preference.place_id: user_preference
+        async for user_preference in iter_user_preferences(messages, places, fairness, rankings)
+    }
+    return [preferences_by_id[place.id] for place in places]
 
-    async def get_place_score(place_full_response: PlaceFullResponse) -> PlaceRanking:
-        place_details = Place(
-            id=place_full_response.id,
-            displayName=place_full_response.displayName,
-            location=place_full_response.location,
-            rating=place_full_response.rating,
-            userRatingCount=place_full_response.userRatingCount,
-            types=place_full_response.types,
-            currentOpeningHours=place_full_response.currentOpeningHours,
-            goodForChildren=place_full_response.goodForChildren,
-            goodForGroups=place_full_response.goodForGroups,
-            liveMusic=place_full_response.liveMusic,
-            allowedDogs=place_full_response.allowedDogs,
-            outdoorSeating=place_full_response.outdoorSeating,
-            parkingOptions=place_full_response.parkingOptions,
-            dineIn=place_full_response.dineIn,
-            delivery=place_full_response.delivery,
-            reservable=place_full_response.reservable,
-            priceLevel=place_full_response.priceLevel,
-            priceRange=place_full_response.priceRange,
-        )
 
-        place_score_pv = await client.aio.models.generate_content(
-            model=LITE_MODEL,
-            contents=SCORING_PROMPT.format(
-                conversation_history="\n".join(
-                    [message.content for message in messages]
-                ),
-                place_details=place_details,
-            ),
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=PlaceRanking,
-            ),
+def iter_user_preferences(
+    messages: List[Message],
+    places: List[PlaceFullResponse],
+    fairness: Optional[Dict[str, float]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
+) -> AsyncIterator[UserPreferences]:
+    """Score the places, yielding each user preference as soon as it is ready.
+    Dispatches to per-place or batched scoring depending on `SCORING_MODE`.
+
+    Args:
+        messages: The conversation history.
+        places: The places to get the user preferences for.
+        fairness: Location scores by place id (see `utils.scoring.location_scores`)
+            that replace the LLM location score in local final scoring.
+        rankings: If given, filled with the criteria scores by place id, e.g.
+            to keep them in the conversation's session.
+
+    Returns:
+        An async iterator of user preferences, in completion order.
+    """
+    if SCORING_MODE == "batched":
+        return iter_scores_batched(messages, places, fairness, rankings)
+    return iter_scores_per_place(messages, places, fairness, rankings)
+
+
+async def iter_scores_per_place(
+    messages: List[Message],
+    places: List[PlaceFullResponse],
+    fairness: Optional[Dict[str, float]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
+) -> AsyncIterator[UserPreferences]:
+    """Score places with two LLM calls per place.
+    For this we firstly get the place scores for various criteria based on the
+    conversation history and the place details (useful information from retrieved places).
+    Then we get the final score for each place from its own place scores, either
+    locally (see `utils.scoring`) or with one more LLM call per place, depending
+    on `FINAL_SCORING_MODE`.
+
+    Args:
+        messages: The conversation history.
+        places: The places to get the user preferences for.
+        fairness: Location scores by place id for local final scoring.
+        rankings: If given, filled with the criteria scores by place id.
+
+    Yields:
+        The user preference of each place, as soon as it is scored.
+    """
+    # Computed once, before the fan-out, and shared by every scoring call. When
+    # the prefix with the full history goes through the context cache (see
+    # `utils.context_cache`), it is sent once and need not be summarized.
+    scoring_history = render_conversation(messages)
+    scoring_prefix = SharedPrefix(
+        scheduler, LITE_MODEL, SCORING_PREFIX_PROMPT.format(conversation_history=scoring_history)
+    )
+    conversation_history = None
+    if not scoring_prefix.cacheable or FINAL_SCORING_MODE != "local":
+        conversation_history = await scoring_conversation(messages)
+    if not scoring_prefix.cacheable:
+        scoring_history = conversation_history
+        scoring_prefix = SharedPrefix(
+            scheduler, LITE_MODEL, SCORING_PREFIX_PROMPT.format(conversation_history=scoring_history)
         )
+    # Keyed by what the prompt reads, so unchanged preferences reuse the scores
+    conversation = history_fingerprint(scoring_history)
 
-        if not place_score_pv.parsed:
-            raise HTTPException(status_code=500, detail="Failed to parse place ranking")
+    async def get_place_score(place_full_response: PlaceFullResponse) -> PlaceRanking:
+        # Reuse the ranking if this place was already scored against the same conversation text
+        cache_key = score_cache_key(place_full_response, conversation, LITE_MODEL)
+        cached_score = await score_cache.aget(cache_key)
+        if cached_score is not None:
+            count("score_cache_hits")
+            return cached_score
+        count("score_cache_misses")
+
+        async def score() -> PlaceRanking:
+            with span("place_scoring"):
+                place_score_pv = await scoring_prefix.generate_content(
+                    priority=Priority.LOW,
+                    suffix=SCORING_PLACE_PROMPT.format(place_details=render_place(place_full_response)),
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=PlaceRanking,
+                    ),
+                )
 
-        place_score = place_score_pv.parsed
-        place_score.id = place_full_response.id
-        return place_score
+            if not place_score_pv.parsed:
+                raise HTTPException(status_code=500, detail="Failed to parse place ranking")
 
-    # Get all place scores in parallel
-    place_scores = await asyncio.gather(*[get_place_score(place) for place in places])
+            place_score = place_score_pv.parsed
+            place_score.id = place_full_response.id
+            await score_cache.aset(cache_key, place_score)
+            return place_score
 
-    print(place_scores)
+        # Chats of the same conversation scoring this place right now share one call
+        return await score_flight.do(cache_key, score)
 
     async def get_final_score(
-        place_score: PlaceRanking, place_details: Place
+        place_score: PlaceRanking, place: PlaceFullResponse
     ) -> UserPreferences:
-        final_score_pv = await client.aio.models.generate_content(
+        # Only this place's own scores go in the prompt, so prompt size stays
+        # linear in the number of places.
+        final_score_pv = await scheduler.generate_content(
+            priority=Priority.LOW,
             model=LITE_MODEL,
             contents=FINAL_SCORING_PROMPT.format(
-                conversation_history="\n".join(
-                    [message.content for message in messages]
-                ),
-                place_details=place_details,
-                place_scores=place_scores,
+                conversation_history=conversation_history,
+                place_details=render_place(place),
+                place_scores=render_place_scores(place_score),
             ),
             config=types.GenerateContentConfig(
                 response_mime_type="application/json",
@@ -378,12 +697,292 @@ async def get_user_preferences(
         final_score.place_id = place_score.id
         return final_score
 
-    # Get all final scores in parallel
-    user_preferences = await asyncio.gather(
-        *[
-            get_final_score(place_score, place_details)
-            for place_score, place_details in zip(place_scores, places)
+    async def score_place(place: PlaceFullResponse) -> UserPreferences:
+        place_score = await get_place_score(place)
+        if rankings is not None:
+            rankings[place.id] = place_score
+        with span("final_scoring"):
+            if FINAL_SCORING_MODE == "local":
+                return final_scores([place_score], location_scores=fairness)[0]
+            return await get_final_score(place_score, place)
+
+    # Score all places in parallel, yielding them as they complete
+    async with aclosing(iter_completed(score_place(place) for place in places)) as results:
+        async for user_preference in results:
+            yield user_preference
+
+
+async def iter_scores_batched(
+    messages: List[Message],
+    places: List[PlaceFullResponse],
+    fairness: Optional[Dict[str, float]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
+) -> AsyncIterator[UserPreferences]:
+    """Score places in batches with one structured LLM call per batch.
+    Each call gets a compact table of up to `SCORING_BATCH_SIZE` places and returns
+    the criteria scores and the final score for every place in it, so the number
+    of LLM calls grows with the number of batches rather than the number of places.
+    Places already scored against this conversation are taken from the score
+    cache and left out of the batches. Places the model leaves out of its answer
+    fall back to per-place scoring.
+
+    Args:
+        messages: The conversation history.
+        places: The places to get the user preferences for.
+        fairness: Location scores by place id for local final scoring.
+        rankings: If given, filled with the criteria scores by place id.
+
+    Yields:
+        The user preferences of each batch, as soon as the batch is scored.
+    """
+    conversation_history = await scoring_conversation(messages)
+
+    async def score_batch(batch: List[PlaceFullResponse]) -> List[PlaceBatchScore]:
+        with span("batch_scoring"):
+            batch_scores_pv = await scheduler.generate_content(
+                priority=Priority.LOW,
+                model=LITE_MODEL,
+                contents=BATCH_SCORING_PROMPT.format(
+                    conversation_history=conversation_history,
+                    places_table=render_places_table(batch),
+                ),
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=list[PlaceBatchScore],
+                ),
+            )
+
+        if batch_scores_pv.parsed is None:
+            raise HTTPException(status_code=500, detail="Failed to parse batch place rankings")
+
+        return batch_scores_pv.parsed
+
+    def to_user_preferences(place_scores: List[PlaceRanking]) -> List[UserPreferences]:
+        if rankings is not None:
+            rankings.update((place_score.id, place_score) for place_score in place_scores)
+        if FINAL_SCORING_MODE == "local":
+            with span("final_scoring"):
+                return final_scores(place_scores, location_scores=fairness)
+        return [
+            UserPreferences(place_id=place_score.id, score=place_score.score)
+            for place_score in place_scores
         ]
-    )
 
-    return user_preferences
+    conversation = history_fingerprint(conversation_history)
+    cache_keys = {
+        place.id: score_cache_key(place, conversation, LITE_MODEL) for place in places
+    }
+
+    scored_ids = set()
+    cached_scores = []
+    for place in places:
+        cached_score = await score_cache.aget(cache_keys[place.id])
+        # The LLM final score is only available on rankings from a batched call
+        if cached_score is not None and (
+            FINAL_SCORING_MODE == "local" or isinstance(cached_score, PlaceBatchScore)
+        ):
+            count("score_cache_hits")
+            scored_ids.add(place.id)
+            cached_scores.append(cached_score)
+        else:
+            count("score_cache_misses")
+
+    for user_preference in to_user_preferences(cached_scores):
+        yield user_preference
+
+    to_score = [place for place in places if place.id not in scored_ids]
+    batches = [
+        to_score[i : i + SCORING_BATCH_SIZE]
+        for i in range(0, len(to_score), SCORING_BATCH_SIZE)
+    ]
+
+    async def score_batch_once(batch: List[PlaceFullResponse]) -> List[PlaceBatchScore]:
+        # Identical batches of concurrent chats share one call
+        key = tuple(cache_keys[place.id] for place in batch)
+        return await score_flight.do(key, lambda: score_batch(batch))
+
+    async with aclosing(iter_completed(score_batch_once(batch) for batch in batches)) as results:
+        async for batch_scores in results:
+            new_scores = []
+            for place_score in batch_scores:
+                if place_score.id in cache_keys and place_score.id not in scored_ids:
+                    scored_ids.add(place_score.id)
+                    new_scores.append(place_score)
+                    await score_cache.aset(cache_keys[place_score.id], place_score)
+            payload_logger.info("Batch scores: %s", new_scores)
+            for user_preference in to_user_preferences(new_scores):
+                yield user_preference
+
+    missing = [place for place in places if place.id not in scored_ids]
+    if missing:
+        async with aclosing(iter_scores_per_place(messages, missing, fairness, rankings)) as results:
+            async for user_preference in results:
+                yield user_preference
+
+
+async def get_affected_criteria(
+    previous_messages: List[Message], new_messages: List[Message]
+) -> List[str]:
+    """Ask which criteria scores the new messages of a conversation may change.
+
+    Args:
+        previous_messages: The messages the current scores reflect.
+        new_messages: The messages added since.
+
+    Returns:
+        The affected criteria, in `CRITERIA` order. Every criterion if the
+        answer cannot be had.
+    """
+    try:
+        with span("affected_criteria"):
+            affected_pv = await scheduler.generate_content(
+                priority=Priority.NORMAL,
+                model=LITE_MODEL,
+                contents=AFFECTED_CRITERIA_PROMPT.format(
+                    criteria=", ".join(CRITERIA),
+                    conversation_history=await scoring_conversation(previous_messages),
+                    new_messages=render_conversation(new_messages),
+                ),
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=AffectedCriteria,
+                ),
+            )
+    except Exception as e:
+        logger.warning("Affected criteria failed, re-scoring all criteria: %r", e)
+        return list(CRITERIA)
+
+    if affected_pv.parsed is None:
+        return list(CRITERIA)
+    named = set(affected_pv.parsed.criteria)
+    return [name for name in CRITERIA if name in named]
+
+
+async def rescore_criteria(
+    previous_messages: List[Message],
+    new_messages: List[Message],
+    places: List[PlaceFullResponse],
+    previous: Dict[str, PlaceRanking],
+    criteria: List[str],
+) -> Dict[str, PlaceRanking]:
+    """Re-score already ranked places on some criteria only, in batches.
+
+    Each call gets a table of up to `SCORING_BATCH_SIZE` places and returns
+    just the `criteria` scores, which replace those of the previous rankings.
+    Places the model leaves out, or whose batch fails, keep their previous
+    scores.
+
+    Args:
+        previous_messages: The messages the previous rankings reflect.
+        new_messages: The messages added since.
+        places: The places to re-score, all in `previous`.
+        previous: The previous rankings by place id.
+        criteria: The criteria to re-score.
+
+    Returns:
+        The updated rankings of `places`, by place id.
+    """
+    rescored = {place.id: previous[place.id] for place in places}
+    if not criteria or not places:
+        return rescored
+
+    schema = partial_ranking_model(tuple(criteria))
+    conversation_history = await scoring_conversation(previous_messages)
+
+    async def rescore_batch(batch: List[PlaceFullResponse]) -> list:
+        with span("rescoring"):
+            rescore_pv = await scheduler.generate_content(
+                priority=Priority.LOW,
+                model=LITE_MODEL,
+                contents=RESCORING_PROMPT.format(
+                    criteria=", ".join(criteria),
+                    conversation_history=conversation_history,
+                    new_messages=render_conversation(new_messages),
+                    places_table=render_places_table(batch),
+                ),
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=list[schema],
+                ),
+            )
+        return rescore_pv.parsed or []
+
+    batches = [places[i : i + SCORING_BATCH_SIZE] for i in range(0, len(places), SCORING_BATCH_SIZE)]
+    results = await asyncio.gather(*[rescore_batch(batch) for batch in batches], return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.warning("Re-scoring a batch failed, keeping its previous scores: %r", result)
+            continue
+        for partial in result:
+            if partial.id in rescored:
+                rescored[partial.id] = rescored[partial.id].model_copy(
+                    update={name: getattr(partial, name) for name in criteria}
+                )
+    return rescored
+
+
+async def rerank_follow_up(
+    session: Session,
+    request: SearchRequest,
+    prefetched: Optional[Dict[str, asyncio.Task]] = None,
+    rankings: Optional[Dict[str, PlaceRanking]] = None,
+) -> SearchResponse:
+    """Re-rank the running top places of a conversation for a follow-up turn.
+
+    Only the queries the session has not searched yet go to Maps, and the new
+    candidates they find are scored in full. The kept places are only
+    re-scored on the criteria the new messages affect (see
+    `get_affected_criteria`). All places are then combined locally (see
+    `utils.scoring.final_scores`), whatever `FINAL_SCORING_MODE`, so kept and
+    new places are ranked on the same scale, and the best `SESSION_TOP_K` are
+    kept.
+
+    Args:
+        session: The session of the conversation (see `utils.session`).
+        request: The search request of the turn.
+        prefetched: Speculative searches to reuse (see `search_candidates`).
+        rankings: If given, filled with the criteria scores by place id.
+
+    Returns:
+        The running top places by descending score, with their user preferences.
+    """
+    rankings = {} if rankings is None else rankings
+    new_messages = request.messages[len(session.messages):]
+    kept = [place for place in session.places if is_eligible(place, request.requirements)]
+    known_ids = {place.id for place in session.places}
+
+    fresh = []
+    queries = new_queries(session, request.queries)
+    if queries:
+        candidates = await search_candidates(request.model_copy(update={"queries": queries}), prefetched)
+        fresh = [place for place in candidates if place.id not in known_ids]
+    count("follow_up_new_places", len(fresh))
+
+    async def score_fresh() -> None:
+        async with aclosing(iter_user_preferences(request.messages, fresh, None, rankings)) as scored:
+            async for _ in scored:
+                pass
+
+    async def rescore_kept() -> None:
+        criteria = await get_affected_criteria(session.messages, new_messages)
+        count("follow_up_rescored_criteria", len(criteria))
+        previous = {ranking.id: ranking for ranking in session.rankings}
+        rankings.update(await rescore_criteria(session.messages, new_messages, kept, previous, criteria))
+
+    with span("scoring"):
+        await asyncio.gather(score_fresh(), rescore_kept())
+
+    places = [place for place in kept + fresh if place.id in rankings]
+    fairness = location_scores(places, request.userLocations, request.searchRadius)
+    with span("final_scoring"):
+        user_preferences = final_scores(
+            [rankings[place.id] for place in places], location_scores=fairness
+        )
+    order = sorted(
+        range(len(places)), key=lambda i: user_preferences[i].score, reverse=True
+    )[:SESSION_TOP_K]
+    return SearchResponse(
+        places=[places[i] for i in order],
+        justification="",
+        user_preferences=[user_preferences[i] for i in order],
+    )
@@ -0,0 +1,104 @@
+"""Router for the route planning API."""
+
+import asyncio
+from typing import List, Tuple
+
+import numpy as np
+from fastapi import APIRouter, HTTPException
+
+from models.chat import Location
+from models.route import RouteRequest, RouteResponse, StopKind
+from utils.constants import ROUTE_MAX_POINTS, ROUTE_THREAD_MIN_POINTS
+from utils.metrics import span
+from utils.routing import build_plan, plan_path, travel_matrix
+
+router = APIRouter(prefix="/routes")
+
+
+def plan_routes(
+    durations: np.ndarray, users: int, places: int, driver: int, round_trip: bool
+) -> Tuple[List[int], List[int]]:
+    """Plan the pickup and the itinerary on the travel times.
+
+    Nodes are the users, then the places. The pickup goes from the driver
+    through every other user to the first place; the itinerary goes from the
+    first place through the others.
+
+    Args:
+        durations: The (N, N) travel durations.
+        users: The number of users.
+        places: The number of places.
+        driver: The node of the driver.
+        round_trip: Whether the itinerary ends back at the first place.
+
+    Returns:
+        The pickup and itinerary paths, as node indices.
+    """
+    first_place = users
+    passengers = [user for user in range(users) if user != driver]
+    pickup = plan_path(durations, driver, passengers, end=first_place)
+    itinerary = plan_path(
+        durations,
+        first_place,
+        range(first_place + 1, users + places),
+        end=first_place if round_trip else None,
+    )
+    return pickup, itinerary
+
+
+@router.post("/plan", response_model=RouteResponse)
+async def plan(request: RouteRequest) -> RouteResponse:
+    """Plan how the group gets together and goes through the places.
+
+    Args:
+        request (RouteRequest): The users, the top-ranked places and the travel mode.
+
+    Returns:
+        The pickup order of the users by the driver and the itinerary through
+        the places, with cumulative distances and travel times.
+    """
+    if not request.userLocations:
+        raise HTTPException(status_code=400, detail="At least one user location is required")
+    if not request.places:
+        raise HTTPException(status_code=400, detail="At least one place is required")
+    if any(place.location is None for place in request.places):
+        raise HTTPException(status_code=400, detail="Every place needs a location")
+    if len(request.userLocations) + len(request.places) > ROUTE_MAX_POINTS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {ROUTE_MAX_POINTS} users and places are supported"
+        )
+
+    names = [user.name for user in request.userLocations]
+    if request.driver is None:
+        driver = 0
+    elif request.driver in names:
+        driver = names.index(request.driver)
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown driver {request.driver!r}")
+
+    stops = [
+        (user.name, StopKind.USER, user.name, Location(
+            latitude=user.location.latitude, longitude=user.location.longitude
+        ))
+        for user in request.userLocations
+    ] + [
+        (place.id, StopKind.PLACE, place.displayName, place.location)
+        for place in request.places
+    ]
+
+    with span("route_matrix"):
+        distances, durations = await travel_matrix([stop[3] for stop in stops], request.mode)
+
+    args = (durations, len(request.userLocations), len(request.places), driver, request.roundTrip)
+    with span("route_planning"):
+        # Local search is quadratic per move, so large plans leave the event loop
+        if len(stops) >= ROUTE_THREAD_MIN_POINTS:
+            pickup, itinerary = await asyncio.to_thread(plan_routes, *args)
+        else:
+            pickup, itinerary = plan_routes(*args)
+
+    return RouteResponse(
+        pickup=build_plan(pickup, distances, durations, stops),
+        itinerary=build_plan(itinerary, distances, durations, stops),
+        mode=request.mode,
+    )
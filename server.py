@@ -1,23 +1,50 @@
 """ Server for the place search API. """
+from dotenv import load_dotenv
+
+# Settings from `.env` must be in the environment before `utils.constants` reads it
+load_dotenv(override=True)
+
+# pylint: disable=wrong-import-position
+import atexit
 import logging
 import time
+from contextlib import asynccontextmanager
 import uvicorn
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from routers.health import router as health_router
+from routers.metrics import router as metrics_router
 from routers.places import router as places_router
+from routers.routes import router as routes_router
+from utils.log import setup_logging
+from utils.maps import maps_client
+from utils.metrics import REQUESTS, REQUEST_SECONDS
+from utils.warmup import warmup
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('app.log')
-    ]
-)
+# Configure logging: handlers run on a background thread fed by a queue,
+# the listener is stopped at exit to flush what is left.
+log_listener = setup_logging()
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+# Probed every few seconds, so not logged
+PROBE_PATHS = {"/healthz", "/readyz"}
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Open the shared HTTP session and start warming up the shared clients on
+    startup (see `utils.warmup`), close the session on shutdown."""
+    await maps_client.start()
+    warmup.start()
+    yield
+    await warmup.stop()
+    await maps_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Request/Response logging middleware
 @app.middleware("http")
@@ -29,28 +56,50 @@ async def log_requests(request: Request, call_next):
         call_next: The next middleware function to call.
 
     Returns:
-        The response object.
+        The response object, with a `Server-Timing` header for the time to
+        the start of the response. Per-stage timings of streamed chats are
+        sent as a `timing` event instead (see `ChatRequest.timing`).
     """
-    start_time = time.time()
+    if request.url.path in PROBE_PATHS:
+        return await call_next(request)
+
+    start_time = time.perf_counter()
     # Log request with more details
-    logger.info("[LOG]: Request: %s (Path: %s, Query: %s, Body: %s)", 
-                request.method, 
+    logger.info("[LOG]: Request: %s (Path: %s, Query: %s, Body size: %s)",
+                request.method,
                 request.url.path,
                 str(request.query_params),
-                str(request.body))
+                request.headers.get("content-length", "unknown"),
+                extra={"fields": {
+                    "event": "request",
+                    "method": request.method,
+                    "path": request.url.path,
+                    "body_bytes": request.headers.get("content-length"),
+                }})
 
     # Get response
     response = await call_next(request)
 
     # Calculate processing time
-    process_time = time.time() - start_time
+    process_time = time.perf_counter() - start_time
+    # Route templates keep the label set bounded, unmatched paths are grouped
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    REQUESTS.inc(path=path, status=response.status_code)
+    REQUEST_SECONDS.observe(process_time, path=path)
+    response.headers["Server-Timing"] = f"app;dur={process_time * 1000:.1f}"
 
     # Log response with more details
-    logger.info("[LOG]: Response: %d - Processed in %.2fs (Path: %s, Body: %s)",
+    logger.info("[LOG]: Response: %d - Processed in %.2fs (Path: %s)",
                 response.status_code,
                 process_time,
                 request.url.path,
-                str(response))
+                extra={"fields": {
+                    "event": "response",
+                    "path": request.url.path,
+                    "status": response.status_code,
+                    "duration_ms": round(process_time * 1000, 1),
+                }})
 
     return response
 
@@ -63,6 +112,9 @@ app.add_middleware(
 )
 
 app.include_router(places_router)
+app.include_router(routes_router)
+app.include_router(metrics_router)
+app.include_router(health_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,69 @@
+"""Tests of the LLM scheduler retries."""
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import httpx
+import pytest
+from google.genai import errors
+
+from utils.llm import LLMScheduler, is_retryable
+
+
+class FlakyModels:
+    """Fails the first `failures` calls with `error`, then answers."""
+
+    def __init__(self, error: BaseException, failures: int = 1):
+        self.error = error
+        self.failures = failures
+        self.calls = 0
+
+    async def generate_content(self, model: str, contents, config=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return SimpleNamespace(text="ok")
+
+
+def generate(models: FlakyModels, max_retries: int = 3):
+    scheduler = LLMScheduler(
+        SimpleNamespace(aio=SimpleNamespace(models=models)), max_retries=max_retries, backoff_base=0
+    )
+
+    async def call():
+        return await scheduler.generate_content(model="model", contents="prompt")
+
+    return scheduler, asyncio.run(call())
+
+
+@pytest.mark.parametrize("error", [
+    asyncio.TimeoutError(),
+    httpx.ReadTimeout("timed out"),
+    httpx.ConnectError("refused"),
+    aiohttp.ServerDisconnectedError(),
+    errors.APIError(503, {}),
+    errors.APIError(429, {}),
+])
+def test_transient_errors_are_retryable(error):
+    assert is_retryable(error)
+
+
+@pytest.mark.parametrize("error", [errors.APIError(400, {}), ValueError("bad")])
+def test_other_errors_are_not_retryable(error):
+    assert not is_retryable(error)
+
+
+def test_transport_timeout_is_retried():
+    models = FlakyModels(httpx.ReadTimeout("timed out"), failures=2)
+    scheduler, response = generate(models)
+
+    assert response.text == "ok"
+    assert models.calls == 3
+    assert scheduler.retries == 2
+
+
+def test_retries_give_up():
+    models = FlakyModels(httpx.ConnectTimeout("timed out"), failures=5)
+    with pytest.raises(httpx.ConnectTimeout):
+        generate(models, max_retries=1)
+    assert models.calls == 2
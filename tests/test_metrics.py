@@ -0,0 +1,28 @@
+"""Tests of the stage timings."""
+import asyncio
+
+from routers.places import timed_stream
+from utils.metrics import count, start_trace
+
+
+async def slow_source():
+    for i in range(3):
+        await asyncio.sleep(0.02)
+        count("scored")
+        yield i
+
+
+def test_timed_stream_leaves_out_the_consumer():
+    async def consume():
+        trace = start_trace()
+        async for _ in timed_stream(slow_source(), "scoring"):
+            # Stands in for sending the event to a slow client
+            await asyncio.sleep(0.1)
+        return trace
+
+    trace = asyncio.run(consume())
+    times, seconds = trace.stages["scoring"]
+
+    assert times == 1
+    assert 0.06 <= seconds < 0.2
+    assert trace.counters["scored"] == 3
@@ -0,0 +1,65 @@
+"""Tests of the local place store."""
+from models.place import Location, PlaceFullResponse
+from utils.place_store import PlaceStore
+
+CENTER = Location(latitude=48.8566, longitude=2.3522)
+
+
+def place(place_id: str, *types: str) -> PlaceFullResponse:
+    return PlaceFullResponse(
+        id=place_id,
+        displayName=place_id,
+        googleMapsUri=f"https://maps.google.com/?cid={place_id}",
+        location=CENTER,
+        types=list(types),
+    )
+
+
+def restaurant(place_id: str, *types: str) -> PlaceFullResponse:
+    return place(place_id, *types, "restaurant", "food", "point_of_interest", "establishment")
+
+
+def test_generic_types_do_not_match_other_cuisines():
+    store = PlaceStore()
+    store.add([restaurant("sushi1", "sushi_restaurant"), restaurant("sushi2", "sushi_restaurant")])
+
+    assert store.search("pizza restaurants", CENTER, 1000) == []
+    assert store.lookup("pizza restaurants", CENTER, 1000, min_results=1) is None
+
+
+def test_specific_type_matches():
+    store = PlaceStore()
+    store.add([restaurant("sushi", "sushi_restaurant"), restaurant("pizza", "pizza_restaurant")])
+
+    assert [place.id for place in store.search("pizza restaurants", CENTER, 1000)] == ["pizza"]
+
+
+def test_most_specific_type_wins():
+    store = PlaceStore()
+    store.add([
+        place("wine", "wine_bar", "bar"),
+        place("pub", "bar"),
+    ])
+
+    assert [place.id for place in store.search("wine bars", CENTER, 1000)] == ["wine"]
+    assert {place.id for place in store.search("bars", CENTER, 1000)} == {"wine", "pub"}
+
+
+def test_lookup_only_answers_type_queries():
+    store = PlaceStore()
+    store.add([restaurant(f"pizza{i}", "pizza_restaurant") for i in range(3)])
+
+    assert len(store.lookup("pizza restaurants", CENTER, 1000, min_results=3)) == 3
+    assert store.lookup("Joe's Pizza Brooklyn", CENTER, 1000, min_results=1) is None
+    assert store.lookup("cheap pizza", CENTER, 1000, min_results=1) is None
+    assert store.lookup("rooftop pizza restaurants", CENTER, 1000, min_results=1) is None
+
+
+def test_evicted_types_leave_the_index():
+    store = PlaceStore(max_entries=1)
+    store.add([restaurant("sushi", "sushi_restaurant")])
+    store.add([restaurant("pizza", "pizza_restaurant")])
+
+    assert "sushi_restaurant" not in store._types
+    assert "sushi_restaurant" not in store._type_tokens
+    assert [place.id for place in store.search("pizza restaurants", CENTER, 1000)] == ["pizza"]
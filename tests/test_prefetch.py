@@ -0,0 +1,58 @@
+"""Tests of the speculative searches of a chat turn."""
+import asyncio
+from types import SimpleNamespace
+
+from fastapi import HTTPException
+
+import routers.places
+import utils.prefetch
+from models.chat import ChatRequest, Message, User
+from models.place import Location, SearchQueries
+
+
+def test_follow_up_cancels_searches_of_known_queries(monkeypatch):
+    started = {}
+
+    async def search_places(query, location, radius):
+        started[query] = asyncio.current_task()
+        await asyncio.sleep(60)
+        return []
+
+    async def generate_search_queries(messages):
+        await asyncio.sleep(0)
+        return SearchQueries(queries=["pizza restaurants", "wine bars"])
+
+    async def aget(conversation_id):
+        return SimpleNamespace(queries=["pizza restaurants"])
+
+    taken = {}
+
+    async def rerank_follow_up(session, request, prefetched, rankings):
+        taken.update(prefetched)
+        raise HTTPException(status_code=500, detail="stop")
+
+    monkeypatch.setattr(routers.places, "SPECULATIVE_PREFETCH", True)
+    monkeypatch.setattr(utils.prefetch, "search_places", search_places)
+    monkeypatch.setattr(routers.places, "generate_search_queries", generate_search_queries)
+    monkeypatch.setattr(routers.places, "session_store", SimpleNamespace(aget=aget))
+    monkeypatch.setattr(routers.places, "is_follow_up", lambda *args: True)
+    monkeypatch.setattr(routers.places, "rerank_follow_up", rerank_follow_up)
+
+    request = ChatRequest(
+        messages=[Message(role="user", content="Some pizza, then a wine bar?")],
+        userLocations=[User(name="Ana", location=Location(latitude=48.85, longitude=2.35))],
+        previousQueries=["pizza restaurants"],
+        conversationId="conversation",
+    )
+
+    async def run():
+        response = await routers.places.find_places(request)
+        async for _ in response.body_iterator:
+            pass
+        await asyncio.sleep(0)
+        assert list(taken) == ["wine bars"]
+        assert started["pizza restaurants"].cancelled()
+        assert not taken["wine bars"].cancelled()
+        taken["wine bars"].cancel()
+
+    asyncio.run(run())
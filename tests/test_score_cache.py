@@ -0,0 +1,76 @@
+"""Tests of the score cache across turns of a conversation."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import routers.places
+import utils.conversation
+from models.chat import Message
+from models.place import Location, PlaceFullResponse, PlaceRanking
+from utils.cache import MemoryCache
+from utils.llm import LLMScheduler
+from utils.scoring import CRITERIA
+
+LONG_MESSAGE = "We are five, one of us is vegetarian and we want somewhere quiet. " * 40
+
+
+class FakeModels:
+    """Answers summaries with `summary` and scoring calls with neutral scores."""
+
+    def __init__(self, summary: str):
+        self.summary = summary
+        self.scoring_calls = 0
+
+    async def generate_content(self, model: str, contents, config=None):
+        schema = getattr(config, "response_schema", None)
+        if schema is None:
+            return SimpleNamespace(text=self.summary, parsed=None)
+        self.scoring_calls += 1
+        return SimpleNamespace(text=None, parsed=PlaceRanking(id="", **{name: 0.5 for name in CRITERIA}))
+
+
+@pytest.fixture
+def models(monkeypatch) -> FakeModels:
+    models = FakeModels("Everyone: vegetarian options, quiet")
+    scheduler = LLMScheduler(SimpleNamespace(aio=SimpleNamespace(models=models)))
+    monkeypatch.setattr(routers.places, "scheduler", scheduler)
+    monkeypatch.setattr(utils.conversation, "scheduler", scheduler)
+    monkeypatch.setattr(routers.places, "score_cache", MemoryCache(ttl=60, max_entries=100))
+    monkeypatch.setattr(utils.conversation, "summary_cache", MemoryCache(ttl=60, max_entries=100))
+    return models
+
+
+def score(messages):
+    places = [
+        PlaceFullResponse(
+            id=f"place{i}",
+            displayName=f"Place {i}",
+            googleMapsUri=f"https://maps.google.com/?cid={i}",
+            location=Location(latitude=48.85, longitude=2.35),
+        )
+        for i in range(3)
+    ]
+
+    async def collect():
+        return [preference async for preference in routers.places.iter_scores_per_place(messages, places)]
+
+    return asyncio.run(collect())
+
+
+def test_follow_up_with_same_preferences_hits(models):
+    messages = [Message(role="user", content=LONG_MESSAGE)]
+    score(messages)
+    assert models.scoring_calls == 3
+
+    score(messages + [Message(role="model", content="Noted!"), Message(role="user", content="Thanks!")])
+    assert models.scoring_calls == 3
+
+
+def test_follow_up_with_new_preferences_misses(models):
+    messages = [Message(role="user", content=LONG_MESSAGE)]
+    score(messages)
+
+    models.summary = "Everyone: vegetarian options, quiet, outdoor seating"
+    score(messages + [Message(role="user", content="Somewhere with a terrace please")])
+    assert models.scoring_calls == 6
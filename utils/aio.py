@@ -0,0 +1,27 @@
+"""Asyncio helpers."""
+import asyncio
+from typing import AsyncIterator, Awaitable, Iterable, TypeVar
+
+T = TypeVar("T")
+
+
+async def iter_completed(awaitables: Iterable[Awaitable[T]]) -> AsyncIterator[T]:
+    """Yield the results of awaitables in completion order.
+
+    Unlike `asyncio.as_completed`, the pending awaitables are cancelled when the
+    consumer stops iterating early (e.g. the client disconnected) or one of
+    them fails.
+
+    Args:
+        awaitables: The awaitables to run concurrently.
+
+    Yields:
+        Their results, as soon as each one completes.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
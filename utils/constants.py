@@ -1,10 +1,114 @@
-""" Constants for the server. """
+""" Constants for the server. Settings from the environment are read at import,
+so `.env` is loaded by the entrypoint (`server.py`) before this module is imported. """
 import os
-from dotenv import load_dotenv
-
-load_dotenv(override=True)
 
 MAPS_API_URL="https://places.googleapis.com/v1/places:searchText"
 GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY")
 LITE_MODEL="gemini-2.0-flash"
 PRO_MODEL="gemini-2.5-pro-preview-03-25"
+
+# One search with every field a chat needs. Text Search bills the highest tier among the requested
+# fields, and the scoring reads Enterprise + Atmosphere fields (goodForChildren, liveMusic, ...), so
+# the address, links, phone and photos come at no extra SKU; fetching them from Place Details would
+# bill one more call per place.
+MAPS_FIELD_MASK="places.id,places.displayName,places.formattedAddress,places.websiteUri,places.googleMapsUri,places.types,places.currentOpeningHours,places.businessStatus,places.goodForChildren,places.goodForGroups,places.liveMusic,places.allowsDogs,places.outdoorSeating,places.parkingOptions,places.dineIn,places.delivery,places.internationalPhoneNumber,places.photos,places.rating,places.userRatingCount,places.reservable,places.priceRange,places.priceLevel,places.location"
+MAPS_PAGE_SIZE=10
+MAPS_MAX_IN_FLIGHT=32 # Cap on concurrent Maps requests across the process
+MAPS_POOL_SIZE=64 # Max pooled keep-alive connections
+MAPS_TIMEOUT_SECONDS=10.0 # Total timeout per Maps call
+MAPS_CONNECT_TIMEOUT_SECONDS=3.0
+
+SCORING_MODE="per_place" # "per_place" (one LLM call per place) or "batched" (one call per batch of places)
+SCORING_BATCH_SIZE=15 # Max places per batched scoring call
+
+FINAL_SCORING_MODE="local" # "local" (weighted mean of the criteria scores) or "llm" (one LLM call per place)
+NEUTRAL_SCORE=0.5 # Final score for a place when no criteria was mentioned in the conversation
+CRITERIA_WEIGHTS={ # Per-criterion weights for local final scoring, unlisted criteria weigh 1.0
+    "displayName": 0.5,
+    "location": 1.5,
+    "rating": 1.0,
+    "rating_count": 0.5,
+    "types": 2.0,
+}
+
+MAPS_CACHE_TTL_SECONDS=6 * 60 * 60 # How long Text Search results stay cached
+MAPS_CACHE_MAX_ENTRIES=4096 # LRU bound on cached searches
+MAPS_CACHE_GEOHASH_PRECISION=6 # Bias centers in the same ~1.2 km geohash cell share cache entries
+MAPS_CACHE_PATH=os.getenv("MAPS_CACHE_PATH") # SQLite file for an on-disk cache, in memory if unset
+
+SCORE_CACHE_TTL_SECONDS=60 * 60 # How long per-place LLM rankings are reused
+SCORE_CACHE_MAX_ENTRIES=20000 # LRU bound on cached rankings
+
+LLM_MAX_CONCURRENCY=16 # Process-wide cap on in-flight Gemini calls
+LLM_REQUESTS_PER_MINUTE=2000 # Gemini quota, requests per minute
+LLM_TOKENS_PER_MINUTE=4_000_000 # Gemini quota, tokens per minute
+LLM_MAX_RETRIES=4 # Retries on 429/5xx/timeouts
+LLM_BACKOFF_BASE_SECONDS=0.5
+LLM_BACKOFF_MAX_SECONDS=8.0
+LLM_EXPECTED_OUTPUT_TOKENS=512 # Output tokens reserved per call until actual usage is known
+
+PREFILTER_TOP_K=20 # Candidates kept for LLM scoring unless the request sets `topK`
+PREFILTER_MIN_RATING_COUNT=5 # Places with fewer known ratings are dropped
+PREFILTER_EXCLUDED_STATUSES={"CLOSED_PERMANENTLY", "CLOSED_TEMPORARILY"}
+PREFILTER_WEIGHTS={ # Weights of the heuristic pre-ranking features
+    "rating": 1.0,
+    "rating_count": 0.5,
+    "distance": 1.0,
+    "type_match": 1.5,
+}
+
+SEARCH_RADIUS_MIN_M=2000 # Search radius bounds; Maps caps locationBias circles at 50 km
+SEARCH_RADIUS_MAX_M=50000
+SEARCH_RADIUS_PADDING_M=1500 # Added to the farthest user's distance from the center
+SEARCH_RADIUS_SPREAD_FACTOR=1.0
+FAIRNESS_STD_WEIGHT=1.0 # Weight of the spread of user distances in the location score
+FAIRNESS_REFERENCE_FACTOR=3.0 # The location score reaches 0 at this many search radii
+
+PLACE_STORE_TTL_SECONDS=24 * 60 * 60 # How long fetched places are served from the local store
+PLACE_STORE_MAX_ENTRIES=50000 # Bound on stored places, oldest evicted first
+PLACE_STORE_GEOHASH_PRECISION=6 # Finest geohash level of the spatial index
+PLACE_STORE_MAX_LOOKUP_CELLS=16 # A lookup uses the finest level covering the circle in at most this many cells
+PLACE_STORE_MIN_RESULTS=MAPS_PAGE_SIZE # Local matches needed to skip the Maps call for a query (a full page)
+PLACE_STORE_PATH=os.getenv("PLACE_STORE_PATH") # SQLite file to persist the store, in memory only if unset
+
+LOG_LEVEL=os.getenv("LOG_LEVEL", "INFO")
+LOG_PATH=os.getenv("LOG_PATH", "app.log") # JSON lines, rotated by size
+LOG_MAX_BYTES=10 * 1024 * 1024 # Size at which the log file is rotated
+LOG_BACKUP_COUNT=5 # Rotated files kept
+LOG_PAYLOAD_SAMPLE_RATE=float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01")) # Share of verbose payload logs kept
+
+CONVERSATION_SUMMARY_MIN_CHARS=2000 # Longer conversations are summarized once for the scoring prompts
+SUMMARY_CACHE_TTL_SECONDS=60 * 60 # How long a conversation summary is reused
+SUMMARY_CACHE_MAX_ENTRIES=2048 # LRU bound on cached summaries
+
+CONTEXT_CACHE_MODE=os.getenv("CONTEXT_CACHE_MODE", "off") # "off" or "explicit" (shared scoring prefix registered with the Gemini context cache)
+CONTEXT_CACHE_TTL_SECONDS=10 * 60 # Lifetime of a registered prefix on the provider
+CONTEXT_CACHE_REFRESH_SECONDS=60 # Stop reusing a prefix this long before it expires
+CONTEXT_CACHE_MIN_TOKENS=4096 # Provider minimum for explicit caching, shorter prefixes are sent inline
+CONTEXT_CACHE_MAX_ENTRIES=1024 # LRU bound on known registered prefixes
+
+SPECULATIVE_PREFETCH=True # Start Maps searches for guessed queries while the search queries are generated
+SPECULATIVE_MAX_QUERIES=2 # Guessed queries searched per chat
+
+SESSION_TOP_K=20 # Running top places kept for a conversation and re-ranked by follow-up turns
+SESSION_TTL_SECONDS=2 * 60 * 60 # How long a conversation's ranking is kept after its last turn
+SESSION_MAX_ENTRIES=10000 # LRU bound on kept conversations
+SESSION_STORE_PATH=os.getenv("SESSION_STORE_PATH") # SQLite file for the sessions, in memory if unset
+SESSION_MAX_AREA_CHANGE=0.1 # Turns whose search center or radius moved by more than this share of the radius start over
+
+ROUTE_SPEEDS_MPS={"drive": 8.3, "bicycle": 4.2, "walk": 1.4} # Average speeds of the local travel-time stand-in
+ROUTE_DETOUR_FACTOR=1.3 # Road over great-circle distance, for the local stand-in
+ROUTE_MATRIX_CACHE_TTL_SECONDS=60 * 60 # How long a distance matrix is reused for the same set of points
+ROUTE_MATRIX_CACHE_MAX_ENTRIES=1024 # LRU bound on cached matrices
+ROUTE_MAX_POINTS=250 # Users plus places accepted by one plan
+ROUTE_THREAD_MIN_POINTS=40 # Plans over more points run in a worker thread, off the event loop
+ROUTE_MAX_MOVES=1000 # Cap on the improving moves applied by the local search of a route
+
+SINGLE_FLIGHT=True # Identical concurrent Maps searches and scoring calls share one outbound call
+
+BATCH_MAX_REQUESTS=200 # Chats accepted by one /places/chat:batch call
+BATCH_MAX_CONCURRENCY=8 # Chats of a batch planned at a time
+
+WARMUP_MAPS_CONNECTIONS=4 # Pooled Maps connections opened at startup
+WARMUP_LLM_CONNECTIONS=2 # Gemini connections opened at startup
+WARMUP_TIMEOUT_SECONDS=10.0 # Warm-up gives up after this, and the app reports ready anyway
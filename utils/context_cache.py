@@ -0,0 +1,152 @@
+"""Prompt prefixes shared by many LLM calls, registered with the Gemini context cache.
+
+Every per-place scoring call of a request starts with the same instructions
+and conversation history. With `CONTEXT_CACHE_MODE = "explicit"` that prefix
+is registered once with `client.aio.caches` and each call only sends its own
+suffix, pointing at the cached content. The registered name is reused by later
+requests with the same prefix until shortly before it expires. When the mode
+is off, the prefix is below the provider minimum, or registering or using the
+cached content fails, the full prompt is sent as before.
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Optional
+
+from google.genai import errors, types
+
+from utils.cache import MemoryCache
+from utils.constants import (
+    CONTEXT_CACHE_MODE,
+    CONTEXT_CACHE_TTL_SECONDS,
+    CONTEXT_CACHE_REFRESH_SECONDS,
+    CONTEXT_CACHE_MIN_TOKENS,
+    CONTEXT_CACHE_MAX_ENTRIES,
+)
+from utils.llm import LLMScheduler, Priority
+from utils.metrics import count, span
+
+logger = logging.getLogger(__name__)
+
+# Names of the registered prefixes, by `prefix_key`
+prefix_names = MemoryCache(
+    ttl=CONTEXT_CACHE_TTL_SECONDS - CONTEXT_CACHE_REFRESH_SECONDS,
+    max_entries=CONTEXT_CACHE_MAX_ENTRIES,
+)
+
+
+def prefix_key(model: str, text: str) -> str:
+    """Get the key of a registered prefix.
+
+    Args:
+        model: The model the prefix is registered for.
+        text: The prefix text.
+
+    Returns:
+        The hex digest of the model and the text.
+    """
+    return hashlib.sha256(f"{model}\n{text}".encode()).hexdigest()
+
+
+class SharedPrefix:
+    """A prompt prefix shared by the LLM calls of one request.
+
+    The prefix is registered lazily, by the first call that needs it, and
+    concurrent calls wait for that same registration.
+    """
+
+    def __init__(self, scheduler: LLMScheduler, model: str, text: str):
+        self.scheduler = scheduler
+        self.model = model
+        self.text = text
+        self._key = prefix_key(model, text)
+        self._registration: Optional[asyncio.Future] = None
+        self._failed = False
+
+    @property
+    def cacheable(self) -> bool:
+        """Whether the prefix is sent through the context cache."""
+        return (
+            CONTEXT_CACHE_MODE == "explicit"
+            and not self._failed
+            and len(self.text) // 4 >= CONTEXT_CACHE_MIN_TOKENS
+        )
+
+    async def _register(self) -> Optional[str]:
+        name = await prefix_names.aget(self._key)
+        if name is not None:
+            count("context_cache_hits")
+            return name
+
+        try:
+            with span("context_cache"):
+                cached_content = await self.scheduler.client.aio.caches.create(
+                    model=self.model,
+                    config=types.CreateCachedContentConfig(
+                        contents=self.text,
+                        ttl=f"{CONTEXT_CACHE_TTL_SECONDS}s",
+                    ),
+                )
+        except Exception as e:
+            logger.warning("Registering the prompt prefix failed, sending it inline: %r", e)
+            count("context_cache_errors")
+            self._failed = True
+            return None
+
+        count("context_cache_creates")
+        await prefix_names.aset(self._key, cached_content.name)
+        return cached_content.name
+
+    async def cached_content(self) -> Optional[str]:
+        """Get the name of the registered prefix, registering it on first use.
+
+        Returns:
+            The cached content name, or None if the prefix is sent inline.
+        """
+        if not self.cacheable:
+            return None
+        if self._registration is None:
+            self._registration = asyncio.ensure_future(self._register())
+        # Shielded so a cancelled caller does not cancel the registration others wait for
+        return await asyncio.shield(self._registration)
+
+    async def generate_content(
+        self,
+        priority: Priority,
+        suffix: str,
+        config: types.GenerateContentConfig,
+    ) -> types.GenerateContentResponse:
+        """Scheduled `generate_content` on the prefix followed by `suffix`.
+
+        Args:
+            priority: The scheduling priority.
+            suffix: The call-specific rest of the prompt.
+            config: The call config, without `cached_content`.
+
+        Returns:
+            The model response.
+        """
+        name = await self.cached_content()
+        if name is not None:
+            try:
+                return await self.scheduler.generate_content(
+                    priority=priority,
+                    model=self.model,
+                    contents=suffix,
+                    config=config.model_copy(update={"cached_content": name}),
+                )
+            except errors.ClientError as e:
+                if e.code == 429:
+                    raise
+                # Expired or deleted on the provider before our local entry
+                logger.warning("Cached prompt prefix unusable, sending it inline: %r", e)
+                count("context_cache_fallbacks")
+                prefix_names.delete(self._key)
+                self._failed = True
+
+        return await self.scheduler.generate_content(
+            priority=priority,
+            model=self.model,
+            contents=self.text + suffix,
+            config=config,
+        )
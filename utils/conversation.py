@@ -0,0 +1,82 @@
+"""Conversation text for the scoring prompts, summarized once when it is long."""
+import logging
+from typing import List
+
+from google.genai import types
+
+from models.chat import Message
+from utils.cache import MemoryCache
+from utils.constants import (
+    LITE_MODEL,
+    CONVERSATION_SUMMARY_MIN_CHARS,
+    SUMMARY_CACHE_TTL_SECONDS,
+    SUMMARY_CACHE_MAX_ENTRIES,
+)
+from utils.llm import Priority, scheduler
+from utils.metrics import count, span
+from utils.prompts import PREFERENCE_SUMMARY_PROMPT
+from utils.scoring import conversation_fingerprint
+
+logger = logging.getLogger(__name__)
+
+summary_cache = MemoryCache(ttl=SUMMARY_CACHE_TTL_SECONDS, max_entries=SUMMARY_CACHE_MAX_ENTRIES)
+
+
+def render_conversation(messages: List[Message]) -> str:
+    """Join the messages of a conversation into the prompt history.
+
+    Args:
+        messages: The conversation history.
+
+    Returns:
+        The history text, one message per line.
+    """
+    return "\n".join(message.content for message in messages)
+
+
+async def scoring_conversation(messages: List[Message]) -> str:
+    """Get the conversation text shared by all scoring calls of a request.
+
+    Conversations shorter than `CONVERSATION_SUMMARY_MIN_CHARS` are sent as
+    is. Longer ones are reduced to a summary of the stated preferences with
+    one LLM call, cached by conversation fingerprint so every scoring call and
+    every later request on the same conversation reuses it. The summary is
+    generated at temperature 0, so a follow-up turn that adds no preference
+    tends to get the same summary, and with it the cached scores (see
+    `utils.scoring.history_fingerprint`). If summarizing fails, the full
+    history is used.
+
+    Args:
+        messages: The conversation history.
+
+    Returns:
+        The history or its preference summary.
+    """
+    history = render_conversation(messages)
+    if len(history) < CONVERSATION_SUMMARY_MIN_CHARS:
+        return history
+
+    key = conversation_fingerprint(messages)
+    summary = await summary_cache.aget(key)
+    if summary is not None:
+        count("summary_cache_hits")
+        return summary
+    count("summary_cache_misses")
+
+    try:
+        with span("summary"):
+            response = await scheduler.generate_content(
+                priority=Priority.NORMAL,
+                model=LITE_MODEL,
+                contents=PREFERENCE_SUMMARY_PROMPT.format(conversation_history=history),
+                config=types.GenerateContentConfig(temperature=0),
+            )
+    except Exception as e:
+        logger.warning("Conversation summary failed, using the full history: %r", e)
+        return history
+
+    summary = (response.text or "").strip()
+    if not summary:
+        return history
+    await summary_cache.aset(key, summary)
+    return summary
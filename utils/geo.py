@@ -0,0 +1,253 @@
+"""Geographic helpers: geohashes, vectorized distances and group fairness."""
+import math
+from typing import List, NamedTuple, Set, Tuple
+
+import numpy as np
+
+from models.chat import Location
+from utils.constants import (
+    SEARCH_RADIUS_MIN_M,
+    SEARCH_RADIUS_MAX_M,
+    SEARCH_RADIUS_PADDING_M,
+    SEARCH_RADIUS_SPREAD_FACTOR,
+    FAIRNESS_STD_WEIGHT,
+)
+
+EARTH_RADIUS_M = 6_371_000.0
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    """Encode a coordinate as a geohash.
+
+    Nearby coordinates share a prefix, so a geohash of a given precision works
+    as a grid cell id (precision 6 is roughly 1.2 km x 0.6 km).
+
+    Args:
+        latitude: The latitude in degrees.
+        longitude: The longitude in degrees.
+        precision: The number of geohash characters.
+
+    Returns:
+        The geohash.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            value, bounds = longitude, lon_range
+        else:
+            value, bounds = latitude, lat_range
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits = bits << 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """Size of a geohash cell of a given precision.
+
+    Args:
+        precision: The number of geohash characters.
+
+    Returns:
+        The cell height (latitude) and width (longitude), in degrees.
+    """
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def _bounding_box(center: Location, radius: float) -> Tuple[float, float, float]:
+    """Latitude bounds and longitude half-width of a circle's bounding box, in degrees."""
+    delta_lat = math.degrees(radius / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(center.latitude))
+    delta_lon = 180.0 if cos_lat < 1e-9 else min(180.0, delta_lat / cos_lat)
+    return max(-90.0, center.latitude - delta_lat), min(90.0, center.latitude + delta_lat), delta_lon
+
+
+def geohash_cover_size(center: Location, radius: float, precision: int) -> int:
+    """Number of grid points `geohash_cover` encodes, an upper bound on its cells."""
+    cell_lat, cell_lon = geohash_cell_size(precision)
+    min_lat, max_lat, delta_lon = _bounding_box(center, radius)
+    lat_steps = math.ceil((max_lat - min_lat) / cell_lat) + 1
+    lon_steps = math.ceil(2 * delta_lon / cell_lon) + 1
+    return lat_steps * lon_steps
+
+
+def geohash_cover(center: Location, radius: float, precision: int) -> Set[str]:
+    """Geohash cells of a given precision covering a circle's bounding box.
+
+    Args:
+        center: The center of the circle.
+        radius: The radius in meters.
+        precision: The number of geohash characters.
+
+    Returns:
+        The geohashes of the covering cells.
+    """
+    cell_lat, cell_lon = geohash_cell_size(precision)
+    min_lat, max_lat, delta_lon = _bounding_box(center, radius)
+    lat_steps = math.ceil((max_lat - min_lat) / cell_lat) + 1
+    lon_steps = math.ceil(2 * delta_lon / cell_lon) + 1
+
+    cells = set()
+    for i in range(lat_steps):
+        latitude = min(max_lat, min_lat + i * cell_lat)
+        for j in range(lon_steps):
+            longitude = center.longitude + min(delta_lon, -delta_lon + j * cell_lon)
+            # Wrap around the antimeridian
+            longitude = (longitude + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(latitude, longitude, precision))
+    return cells
+
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters, broadcast over NumPy arrays.
+
+    Args:
+        lat1: Latitudes of the first points, in degrees.
+        lon1: Longitudes of the first points, in degrees.
+        lat2: Latitudes of the second points, in degrees.
+        lon2: Longitudes of the second points, in degrees.
+
+    Returns:
+        The distances, with the broadcast shape of the inputs.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def coordinates(locations: List[Location]) -> Tuple[np.ndarray, np.ndarray]:
+    """Split locations into latitude and longitude arrays.
+
+    Args:
+        locations: The locations.
+
+    Returns:
+        The latitudes and longitudes, in degrees.
+    """
+    latitudes = np.array([location.latitude for location in locations], dtype=np.float64)
+    longitudes = np.array([location.longitude for location in locations], dtype=np.float64)
+    return latitudes, longitudes
+
+
+def distance_matrix(origins: List[Location], destinations: List[Location]) -> np.ndarray:
+    """Distances from every origin to every destination in one pass.
+
+    Args:
+        origins: The origins, e.g. the users.
+        destinations: The destinations, e.g. the candidate places.
+
+    Returns:
+        The (len(origins), len(destinations)) distance matrix in meters.
+    """
+    origin_lat, origin_lon = coordinates(origins)
+    destination_lat, destination_lon = coordinates(destinations)
+    return haversine_m(
+        origin_lat[:, None], origin_lon[:, None], destination_lat[None, :], destination_lon[None, :]
+    )
+
+
+def spherical_centroid(locations: List[Location]) -> Location:
+    """Center of the locations, averaged as 3D unit vectors.
+
+    Unlike averaging raw latitudes and longitudes, this is correct across the
+    antimeridian and near the poles.
+
+    Args:
+        locations: The locations, at least one.
+
+    Returns:
+        The centroid.
+    """
+    latitudes, longitudes = (np.radians(values) for values in coordinates(locations))
+    x = np.mean(np.cos(latitudes) * np.cos(longitudes))
+    y = np.mean(np.cos(latitudes) * np.sin(longitudes))
+    z = np.mean(np.sin(latitudes))
+    if np.hypot(x, y) < 1e-12 and abs(z) < 1e-12:
+        # Antipodal locations have no meaningful center, fall back to the first one
+        return locations[0]
+    return Location(
+        latitude=float(np.degrees(np.arctan2(z, np.hypot(x, y)))),
+        longitude=float(np.degrees(np.arctan2(y, x))),
+    )
+
+
+def search_area(locations: List[Location]) -> Tuple[Location, int]:
+    """Pick the search center and radius from how the users are spread out.
+
+    The center is the spherical centroid of the users. The radius covers the
+    farthest user (scaled by `SEARCH_RADIUS_SPREAD_FACTOR`) plus a padding,
+    clamped to [`SEARCH_RADIUS_MIN_M`, `SEARCH_RADIUS_MAX_M`].
+
+    Args:
+        locations: The user locations, at least one.
+
+    Returns:
+        The search center and the radius in meters.
+    """
+    center = spherical_centroid(locations)
+    spread = distance_matrix([center], locations).max()
+    radius = spread * SEARCH_RADIUS_SPREAD_FACTOR + SEARCH_RADIUS_PADDING_M
+    return center, int(np.clip(radius, SEARCH_RADIUS_MIN_M, SEARCH_RADIUS_MAX_M))
+
+
+class FairnessMetrics(NamedTuple):
+    """Per-place distance statistics over the users, in meters."""
+    max: np.ndarray
+    mean: np.ndarray
+    variance: np.ndarray
+
+
+def fairness_metrics(distances: np.ndarray) -> FairnessMetrics:
+    """Reduce a users x places distance matrix to per-place fairness metrics.
+
+    Args:
+        distances: The (U, P) distance matrix.
+
+    Returns:
+        The (P,) max, mean and variance of the distance to each place.
+    """
+    return FairnessMetrics(
+        max=distances.max(axis=0),
+        mean=distances.mean(axis=0),
+        variance=distances.var(axis=0),
+    )
+
+
+def fairness_scores(metrics: FairnessMetrics, reference: float) -> np.ndarray:
+    """Turn fairness metrics into a location score in [0, 1].
+
+    A place scores 1 when everyone is next to it and 0 once the farthest user
+    distance, plus `FAIRNESS_STD_WEIGHT` standard deviations, reaches
+    `reference`. The deviation term favors places that are equally far for
+    everyone over ones that are close for some and far for others.
+
+    Args:
+        metrics: The per-place fairness metrics.
+        reference: The distance in meters at which the score reaches 0.
+
+    Returns:
+        The (P,) location scores.
+    """
+    cost = metrics.max + FAIRNESS_STD_WEIGHT * np.sqrt(metrics.variance)
+    return 1.0 - np.clip(cost / reference, 0.0, 1.0)
@@ -0,0 +1,296 @@
+"""The scheduler that every LLM call goes through, and its shared Gemini client."""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import aiohttp
+import httpx
+from google import genai
+from google.genai import errors, types
+
+from utils.constants import (
+    GOOGLE_API_KEY,
+    LLM_MAX_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE_SECONDS,
+    LLM_BACKOFF_MAX_SECONDS,
+    LLM_EXPECTED_OUTPUT_TOKENS,
+)
+from utils.metrics import count
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Scheduling priority of an LLM call, lower runs first."""
+    HIGH = 0  # User-facing streaming (justification)
+    NORMAL = 1  # Query generation
+    LOW = 2  # Scoring fan-out
+
+
+class PrioritySemaphore:
+    """Semaphore that wakes waiters by priority, then in arrival order."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: list = []
+        self._counter = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        """Acquire a slot, waiting behind higher priority waiters."""
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # The slot may have been handed over right before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        """Release a slot, handing it to the first live waiter if any."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take `amount` tokens, sleeping until they are available.
+
+        Args:
+            amount: The number of tokens, capped at the bucket capacity.
+
+        Returns:
+            The time spent waiting, in seconds.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                delay = (amount - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+                self._refill()
+            self._tokens -= amount
+        return waited
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund) tokens after the fact, e.g. once actual usage is known."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
+
+
+# Timeouts and dropped or refused connections, from either transport of the
+# Gemini client (aiohttp when it is installed, httpx otherwise)
+TRANSIENT_ERRORS = (asyncio.TimeoutError, httpx.TransportError, aiohttp.ClientConnectionError)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an LLM call failed with a rate limit, server error, timeout or
+    connection error."""
+    if isinstance(error, errors.APIError):
+        return error.code == 429 or (error.code or 0) >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def estimate_tokens(contents: Any, config: Optional[types.GenerateContentConfig]) -> int:
+    """Roughly estimate the tokens of a call from its text (about 4 characters per token).
+
+    Args:
+        contents: The `contents` of the call.
+        config: The `config` of the call.
+
+    Returns:
+        The estimated prompt plus expected output tokens.
+    """
+    def text_length(value: Any) -> int:
+        if value is None:
+            return 0
+        if isinstance(value, str):
+            return len(value)
+        if isinstance(value, (list, tuple)):
+            return sum(text_length(item) for item in value)
+        if isinstance(value, types.Content):
+            return sum(len(part.text or "") for part in value.parts or [])
+        return len(str(value))
+
+    characters = text_length(contents)
+    if config is not None:
+        characters += text_length(config.system_instruction)
+    return characters // 4 + LLM_EXPECTED_OUTPUT_TOKENS
+
+
+class LLMScheduler:
+    """Process-wide scheduler for Gemini calls.
+
+    Every call waits for a slot of a priority semaphore (so streaming the
+    justification is not starved by the scoring fan-out), then for the
+    requests-per-minute and tokens-per-minute buckets. Calls failing with a
+    429, a 5xx or a timeout are retried with full-jitter exponential backoff.
+
+    Without a `client`, the Gemini client is created on first use rather than
+    at import (see `utils.warmup`).
+    """
+
+    def __init__(
+        self,
+        client: Optional[genai.Client] = None,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE_SECONDS,
+        backoff_max: float = LLM_BACKOFF_MAX_SECONDS,
+    ):
+        self._client = client
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = PrioritySemaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self.calls = 0
+        self.retries = 0
+
+    @property
+    def client(self) -> genai.Client:
+        """The Gemini client, created on first use."""
+        if self._client is None:
+            self._client = genai.Client(api_key=GOOGLE_API_KEY)
+        return self._client
+
+    @client.setter
+    def client(self, client: genai.Client) -> None:
+        self._client = client
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def _admit(self, estimated_tokens: int) -> None:
+        await self._requests.acquire(1)
+        await self._tokens.acquire(estimated_tokens)
+        self.calls += 1
+        count("llm_calls")
+
+    def _charge_usage(self, response: Any, estimated_tokens: int) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        count("llm_prompt_tokens", usage.prompt_token_count or 0)
+        count("llm_response_tokens", usage.candidates_token_count or 0)
+        if usage.cached_content_token_count:
+            count("llm_cached_tokens", usage.cached_content_token_count)
+        total = usage.total_token_count
+        if total:
+            self._tokens.adjust(total - estimated_tokens)
+
+    async def _run(
+        self, priority: Priority, estimated_tokens: int, call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self._slots.acquire(priority)
+            try:
+                await self._admit(estimated_tokens)
+                return await call()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                count("llm_retries")
+                logger.warning("Retrying LLM call after %r (attempt %d)", e, attempt + 1)
+            finally:
+                self._slots.release()
+            await asyncio.sleep(self._backoff(attempt))
+
+    async def generate_content(
+        self, priority: Priority = Priority.NORMAL, **kwargs
+    ) -> types.GenerateContentResponse:
+        """Scheduled `client.aio.models.generate_content`.
+
+        Args:
+            priority: The scheduling priority.
+            **kwargs: The `generate_content` arguments.
+
+        Returns:
+            The model response.
+        """
+        estimated_tokens = estimate_tokens(kwargs.get("contents"), kwargs.get("config"))
+        response = await self._run(
+            priority,
+            estimated_tokens,
+            lambda: self.client.aio.models.generate_content(**kwargs),
+        )
+        self._charge_usage(response, estimated_tokens)
+        return response
+
+    async def generate_content_stream(
+        self, priority: Priority = Priority.HIGH, **kwargs
+    ) -> AsyncIterator[types.GenerateContentResponse]:
+        """Scheduled `client.aio.models.generate_content_stream`.
+
+        The slot is held until the stream is exhausted or closed. Only failures
+        before the first chunk are retried, so no chunk is ever yielded twice.
+
+        Args:
+            priority: The scheduling priority.
+            **kwargs: The `generate_content_stream` arguments.
+
+        Yields:
+            The streamed response chunks.
+        """
+        estimated_tokens = estimate_tokens(kwargs.get("contents"), kwargs.get("config"))
+        for attempt in range(self.max_retries + 1):
+            await self._slots.acquire(priority)
+            started = False
+            try:
+                await self._admit(estimated_tokens)
+                stream = await self.client.aio.models.generate_content_stream(**kwargs)
+                chunk = None
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                self._charge_usage(chunk, estimated_tokens)
+                return
+            except Exception as e:
+                if started or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                self.retries += 1
+                count("llm_retries")
+                logger.warning("Retrying LLM stream after %r (attempt %d)", e, attempt + 1)
+            finally:
+                self._slots.release()
+            await asyncio.sleep(self._backoff(attempt))
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,100 @@
+"""Queue-based logging: records are enqueued on the request path and written
+by a background thread, so no file I/O ever blocks the event loop."""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Optional
+
+from utils.constants import (
+    LOG_LEVEL,
+    LOG_PATH,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+    LOG_PAYLOAD_SAMPLE_RATE,
+)
+
+# Logger for verbose payloads (requests, generated queries, LLM outputs), sampled
+PAYLOAD_LOGGER = "agentic_maps.payloads"
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line.
+
+    Structured fields passed as `extra={"fields": {...}}` are merged into the
+    object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SampleFilter(logging.Filter):
+    """Keep a random `rate` share of the records."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return random.random() < self.rate
+
+
+def setup_logging(
+    path: Optional[str] = LOG_PATH,
+    level: str = LOG_LEVEL,
+    payload_sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE,
+) -> logging.handlers.QueueListener:
+    """Route all logging through a queue drained by a background listener.
+
+    The root logger only gets a `QueueHandler`. The listener writes JSON lines
+    to a size-rotated file (if `path` is set) and readable lines to stderr.
+    Payload logs are sampled before they are enqueued, so dropped ones cost
+    neither formatting nor I/O. Start the listener on startup and stop it on
+    shutdown to flush the queue.
+
+    Args:
+        path: The log file, or None to log to stderr only.
+        level: The root log level.
+        payload_sample_rate: The share of payload logs kept.
+
+    Returns:
+        The listener, not started yet.
+    """
+    log_queue = queue.SimpleQueue()
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    handlers = [console]
+    if path:
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    payload_logger = logging.getLogger(PAYLOAD_LOGGER)
+    for log_filter in payload_logger.filters[:]:
+        payload_logger.removeFilter(log_filter)
+    payload_logger.addFilter(SampleFilter(payload_sample_rate))
+
+    return logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
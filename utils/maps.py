@@ -0,0 +1,431 @@
+"""Async client for the Google Maps Places API.
+
+Searches ask for `MAPS_FIELD_MASK`, every field a chat needs, in one call:
+the scoring fields already set the billed tier (see `utils.constants`).
+"""
+import asyncio
+import hashlib
+import logging
+from operator import itemgetter
+from typing import Awaitable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from pydantic import TypeAdapter
+
+from models.place import Availability, Location, PlaceFullResponse
+from utils.cache import CacheBackend, MemoryCache, SQLiteCache
+from utils.geo import geohash_encode
+from utils.metrics import count, span
+from utils.place_store import place_store
+from utils.singleflight import SingleFlight
+from utils.constants import (
+    MAPS_API_URL,
+    GOOGLE_API_KEY,
+    MAPS_PAGE_SIZE,
+    MAPS_MAX_IN_FLIGHT,
+    MAPS_POOL_SIZE,
+    MAPS_TIMEOUT_SECONDS,
+    MAPS_CONNECT_TIMEOUT_SECONDS,
+    MAPS_FIELD_MASK,
+    MAPS_CACHE_TTL_SECONDS,
+    MAPS_CACHE_MAX_ENTRIES,
+    MAPS_CACHE_GEOHASH_PRECISION,
+    MAPS_CACHE_PATH,
+    PLACE_STORE_MIN_RESULTS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MapsClient:
+    """Pooled, keep-alive client for the Places Text Search API.
+
+    A single instance is shared for the lifetime of the app. The underlying
+    `aiohttp.ClientSession` is opened on `start` (or lazily on first use) and
+    closed on `close`. The number of in-flight requests is capped by a
+    semaphore so a burst of chats cannot exhaust the connection pool.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = GOOGLE_API_KEY,
+        base_url: str = MAPS_API_URL,
+        max_in_flight: int = MAPS_MAX_IN_FLIGHT,
+        pool_size: int = MAPS_POOL_SIZE,
+        timeout: float = MAPS_TIMEOUT_SECONDS,
+        connect_timeout: float = MAPS_CONNECT_TIMEOUT_SECONDS,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        """Open the pooled session if it is not already open."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, timeout=self.timeout
+            )
+
+    async def warm(self, connections: int) -> None:
+        """Open pooled connections ahead of the first searches.
+
+        Sends concurrent HEAD requests to the API origin. They are not API
+        calls, and each leaves a keep-alive connection, with its TLS session,
+        in the pool.
+
+        Args:
+            connections: The number of connections to open, capped at the
+                pool size.
+        """
+        await self.start()
+        scheme, host = urlsplit(self.base_url)[:2]
+
+        async def open_connection() -> None:
+            async with self._session.head(f"{scheme}://{host}/") as response:
+                await response.read()
+
+        await asyncio.gather(*[open_connection() for _ in range(min(connections, self.pool_size))])
+
+    async def close(self) -> None:
+        """Close the pooled session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def search_text(
+        self, query: str, location_bias: dict, field_mask: str
+    ) -> List[dict]:
+        """Run a single Text Search query.
+
+        Args:
+            query: The text query.
+            location_bias: The `locationBias` object for the request body.
+            field_mask: The `X-Goog-FieldMask` header value.
+
+        Returns:
+            The raw place dicts returned by the API.
+        """
+        await self.start()
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "X-Goog-Api-Key": self.api_key or "",
+            "X-Goog-FieldMask": field_mask,
+        }
+        body = {"textQuery": query, "locationBias": location_bias}
+
+        async with self._semaphore:
+            with span("maps_call"):
+                count("maps_calls")
+                async with self._session.post(
+                    self.base_url,
+                    params={"pageSize": MAPS_PAGE_SIZE},
+                    headers=headers,
+                    json=body,
+                ) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+
+        return data.get("places") or []
+
+
+maps_client = MapsClient()
+
+
+def _make_search_cache() -> CacheBackend:
+    """Create the search cache, on disk if `MAPS_CACHE_PATH` is set."""
+    if MAPS_CACHE_PATH:
+        adapter = TypeAdapter(List[PlaceFullResponse])
+        return SQLiteCache(
+            MAPS_CACHE_PATH,
+            ttl=MAPS_CACHE_TTL_SECONDS,
+            max_entries=MAPS_CACHE_MAX_ENTRIES,
+            dumps=adapter.dump_json,
+            loads=adapter.validate_json,
+        )
+    return MemoryCache(ttl=MAPS_CACHE_TTL_SECONDS, max_entries=MAPS_CACHE_MAX_ENTRIES)
+
+
+search_cache = _make_search_cache()
+search_flight = SingleFlight("maps")
+
+
+_AVAILABILITY = {
+    True: Availability.TRUE,
+    "TRUE": Availability.TRUE,
+    "true": Availability.TRUE,
+    False: Availability.FALSE,
+    "FALSE": Availability.FALSE,
+    "false": Availability.FALSE,
+}
+
+
+def map_to_availability(value) -> Availability:
+    """Map a value to an availability enum.
+
+    Args:
+        value: The value to map.
+
+    Returns:
+        The mapped availability.
+    """
+    try:
+        return _AVAILABILITY.get(value, Availability.NOT_AVAILABLE)
+    except TypeError:  # Unhashable values
+        return Availability.NOT_AVAILABLE
+
+
+def _parking_availability(value: dict) -> Availability:
+    """Parking is available if any of the `parkingOptions` is."""
+    options = [option for option in value.values() if isinstance(option, bool)]
+    if not options:
+        return Availability.NOT_AVAILABLE
+    return Availability.TRUE if any(options) else Availability.FALSE
+
+
+def _money(value: dict) -> str:
+    return f"{value.get('currencyCode', '')} {value.get('units', '0')}".strip()
+
+
+def _price_range(value: dict) -> dict:
+    return {
+        "startPrice": _money(value["startPrice"]) if "startPrice" in value else None,
+        "endPrice": _money(value["endPrice"]) if "endPrice" in value else None,
+    }
+
+
+def _photos(value: list) -> List[str]:
+    return [photo["googleMapsUri"] for photo in value if "googleMapsUri" in photo]
+
+
+# Maps fields copied as is into the model field of the same name. Nested
+# dicts like `location` are validated into models by `model_validate`.
+PASSTHROUGH_FIELDS = [
+    "id",
+    "formattedAddress",
+    "rating",
+    "googleMapsUri",
+    "websiteUri",
+    "location",
+    "userRatingCount",
+    "types",
+    "priceLevel",
+    "internationalPhoneNumber",
+    "businessStatus",
+]
+
+# (model field, Maps field) of the boolean attributes mapped to `Availability`
+AVAILABILITY_FIELDS = [
+    ("goodForChildren", "goodForChildren"),
+    ("goodForGroups", "goodForGroups"),
+    ("liveMusic", "liveMusic"),
+    ("allowedDogs", "allowsDogs"),
+    ("outdoorSeating", "outdoorSeating"),
+    ("dineIn", "dineIn"),
+    ("delivery", "delivery"),
+    ("reservable", "reservable"),
+]
+
+# (model field, Maps field, converter) of the fields that need reshaping
+CONVERTED_FIELDS = [
+    ("displayName", "displayName", itemgetter("text")),
+    ("currentOpeningHours", "currentOpeningHours", lambda value: value.get("weekdayDescriptions", [])),
+    ("parkingOptions", "parkingOptions", _parking_availability),
+    ("priceRange", "priceRange", _price_range),
+    ("photos", "photos", _photos),
+]
+
+_EMPTY_PRICE_RANGE = {"startPrice": None, "endPrice": None}
+
+
+def parse_place(place: dict) -> PlaceFullResponse:
+    """Parse a raw Text Search place into a `PlaceFullResponse`.
+
+    Fields are mapped with the field tables above into one flat dict that is
+    validated in a single `model_validate` call, which builds the nested
+    models too. Fields missing from the response keep the model default.
+
+    Args:
+        place: The raw place dict from the API.
+
+    Returns:
+        The parsed place.
+    """
+    get = place.get
+    values = {"priceRange": _EMPTY_PRICE_RANGE}
+    for field in PASSTHROUGH_FIELDS:
+        value = get(field)
+        if value is not None:
+            values[field] = value
+    for field, source in AVAILABILITY_FIELDS:
+        value = get(source)
+        if value is not None:
+            values[field] = map_to_availability(value)
+    for field, source, convert in CONVERTED_FIELDS:
+        value = get(source)
+        if value is not None:
+            values[field] = convert(value)
+    return PlaceFullResponse.model_validate(values)
+
+
+def location_bias(location: Location, radius: int) -> dict:
+    """Build the `locationBias` circle for a search.
+
+    Args:
+        location: The center of the circle.
+        radius: The radius in meters.
+
+    Returns:
+        The `locationBias` object.
+    """
+    return {
+        "circle": {
+            "center": {
+                "latitude": location.latitude,
+                "longitude": location.longitude,
+            },
+            "radius": radius,
+        }
+    }
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a text query for case and whitespace.
+
+    Args:
+        query: The text query.
+
+    Returns:
+        The normalized query.
+    """
+    return " ".join(query.lower().split())
+
+
+def search_cache_key(
+    query: str, location: Location, radius: int, field_mask: str
+) -> str:
+    """Build the content-addressed cache key of a search.
+
+    The query is normalized for case and whitespace and the bias center is
+    snapped to a geohash cell, so near-identical searches share an entry.
+
+    Args:
+        query: The text query.
+        location: The bias center.
+        radius: The bias radius in meters.
+        field_mask: The field mask of the search.
+
+    Returns:
+        The cache key.
+    """
+    normalized_query = normalize_query(query)
+    cell = geohash_encode(
+        location.latitude, location.longitude, MAPS_CACHE_GEOHASH_PRECISION
+    )
+    content = f"{normalized_query}|{cell}|{radius}|{field_mask}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+async def search_places(
+    query: str,
+    location: Location,
+    radius: int,
+    field_mask: str = MAPS_FIELD_MASK,
+) -> List[PlaceFullResponse]:
+    """Search places for a query, going through the search cache and the
+    local place store.
+
+    Full-mask searches that only name place types ("pizza restaurants") are
+    answered from the place store when it already knows at least
+    `PLACE_STORE_MIN_RESULTS` places of those types within the radius. Queries
+    with names, addresses or qualifiers always go to Maps. Otherwise Maps is called and its results are added to
+    the store. Identical searches in flight at the same time share one call.
+
+    Args:
+        query: The text query.
+        location: The bias center.
+        radius: The bias radius in meters.
+        field_mask: The field mask of the search.
+
+    Returns:
+        The parsed places.
+    """
+    key = search_cache_key(query, location, radius, field_mask)
+    cached = await search_cache.aget(key)
+    if cached is not None:
+        count("maps_cache_hits")
+        return cached
+    count("maps_cache_misses")
+
+    # The store only holds full places, so it cannot answer narrower masks
+    use_store = field_mask == MAPS_FIELD_MASK
+    if use_store:
+        local_places = place_store.lookup(query, location, radius, PLACE_STORE_MIN_RESULTS)
+        if local_places is not None:
+            count("place_store_hits")
+            return local_places[:MAPS_PAGE_SIZE]
+
+    async def search() -> List[PlaceFullResponse]:
+        raw_places = await maps_client.search_text(
+            query, location_bias(location, radius), field_mask
+        )
+        places = [parse_place(place) for place in raw_places]
+        await search_cache.aset(key, places)
+        if use_store:
+            await place_store.aadd(places)
+        return places
+
+    # Concurrent searches with the same key share one Maps call
+    return await search_flight.do(key, search)
+
+
+async def search_places_many(
+    queries: List[str],
+    location: Location,
+    radius: int,
+    field_mask: str = MAPS_FIELD_MASK,
+    prefetched: Optional[Dict[str, Awaitable[List[PlaceFullResponse]]]] = None,
+) -> List[List[PlaceFullResponse]]:
+    """Search places for several queries concurrently.
+
+    A query that fails or times out yields an empty list so that one slow
+    query does not fail the others.
+
+    Args:
+        queries: The text queries.
+        location: The bias center shared by all queries.
+        radius: The bias radius in meters.
+        field_mask: The field mask of the searches.
+        prefetched: Searches already started for the same area and mask, by
+            normalized query (see `utils.prefetch`), awaited instead of
+            searching again.
+
+    Returns:
+        The parsed places for each query, in query order.
+    """
+    prefetched = prefetched or {}
+    results = await asyncio.gather(
+        *[
+            prefetched.get(normalize_query(query))
+            or search_places(query, location, radius, field_mask)
+            for query in queries
+        ],
+        return_exceptions=True,
+    )
+
+    places_per_query = []
+    for query, result in zip(queries, results):
+        if isinstance(result, BaseException):
+            count("maps_errors")
+            logger.warning("Maps search failed for %r: %r", query, result)
+            places_per_query.append([])
+        else:
+            places_per_query.append(result)
+    return places_per_query
@@ -0,0 +1,212 @@
+"""Per-request stage timings and counters, and their Prometheus exposition.
+
+Code wraps each stage of a chat in `span(...)` and reports events with
+`count(...)`. Both feed the process-wide Prometheus metrics below and, when
+a request trace was started with `start_trace`, that request's `Trace`, which
+is found through a context variable so it follows the request into the
+tasks it spawns. Events are attributed to the innermost open span.
+"""
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+METRICS_PREFIX = "agentic_maps"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(
+            name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(labelnames, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        self._values[tuple(str(labels[name]) for name in self.labelnames)] += amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative histogram with labels."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts, with a last +Inf bucket, sum)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return "\n".join(lines)
+
+
+REQUESTS = Counter("requests_total", "HTTP requests by path and status.", ["path", "status"])
+REQUEST_SECONDS = Histogram(
+    "request_seconds", "Time to the start of the HTTP response, by path.", ["path"]
+)
+STAGE_SECONDS = Histogram("stage_seconds", "Duration of chat stages.", ["stage"])
+EVENTS = Counter(
+    "events_total",
+    "Calls, cache lookups, retries and tokens, by event and the stage they happened in.",
+    ["event", "stage"],
+)
+
+REGISTRY = [REQUESTS, REQUEST_SECONDS, STAGE_SECONDS, EVENTS]
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        The exposition text.
+    """
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class Trace:
+    """Stage timings and event counts of a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}  # stage -> [count, seconds]
+        self.counters: Dict[str, float] = defaultdict(float)
+
+    def record(self, stage: str, seconds: float) -> None:
+        entry = self.stages.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def summary(self) -> dict:
+        """Get the timings in milliseconds and the counters, for an SSE trailer.
+
+        Returns:
+            The `stages` (count and total milliseconds per stage) and `counters`.
+        """
+        return {
+            "stages": {
+                stage: {"count": count, "ms": round(seconds * 1000, 1)}
+                for stage, (count, seconds) in self.stages.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_stage: ContextVar[str] = ContextVar("stage", default="none")
+
+
+def start_trace() -> Trace:
+    """Start a trace for the current request and the tasks it spawns from now on.
+
+    Returns:
+        The new trace.
+    """
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller.
+
+    Args:
+        stage: The stage name.
+        seconds: The duration.
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+@contextmanager
+def in_stage(stage: str) -> Iterator[None]:
+    """Attribute the events counted inside to a stage, without timing it.
+
+    Args:
+        stage: The stage name.
+    """
+    previous = _stage.get()
+    _stage.set(stage)
+    try:
+        yield
+    finally:
+        # `set` rather than `reset`: the stage may be left from another context
+        # when it wraps the `yield` of an async generator.
+        _stage.set(previous)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a stage and attribute the events counted inside it to it.
+
+    Args:
+        stage: The stage name.
+    """
+    start = time.perf_counter()
+    try:
+        with in_stage(stage):
+            yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def count(event: str, amount: float = 1.0) -> None:
+    """Count an event in the current stage.
+
+    Args:
+        event: The event name, e.g. "llm_calls" or "score_cache_hits".
+        amount: The amount to add.
+    """
+    EVENTS.inc(amount, event=event, stage=_stage.get())
+    trace = _trace.get()
+    if trace is not None:
+        trace.counters[event] += amount
@@ -0,0 +1,264 @@
+"""Local store of previously fetched places with a spatial and a type index."""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from models.place import Location, PlaceFullResponse
+from utils.constants import (
+    PLACE_STORE_TTL_SECONDS,
+    PLACE_STORE_MAX_ENTRIES,
+    PLACE_STORE_GEOHASH_PRECISION,
+    PLACE_STORE_MAX_LOOKUP_CELLS,
+    PLACE_STORE_PATH,
+)
+from utils.geo import geohash_cover, geohash_cover_size, geohash_encode, haversine_m
+from utils.prefilter import GENERIC_TYPE_TOKENS, tokenize
+
+
+class PlaceStore:
+    """In-memory index of the places fetched from Maps, optionally persisted.
+
+    Places are bucketed by geohash at every precision up to `precision`, so a
+    lookup can pick the level that covers its circle in a handful of cells,
+    and indexed by each of their `types`. A lookup intersects the spatial
+    candidates with the places of a type named in the query, then keeps the
+    ones actually within the radius.
+
+    Places expire `ttl` seconds after they were last fetched and the oldest
+    ones are evicted once `max_entries` is reached. With a `path`, places are
+    also written to a SQLite file and loaded back on startup.
+    """
+
+    def __init__(
+        self,
+        ttl: float = PLACE_STORE_TTL_SECONDS,
+        max_entries: int = PLACE_STORE_MAX_ENTRIES,
+        precision: int = PLACE_STORE_GEOHASH_PRECISION,
+        path: Optional[str] = None,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        # id -> (stored_at, geohash, latitude, longitude, place), oldest first
+        self._places: "OrderedDict[str, tuple]" = OrderedDict()
+        # One {geohash prefix: ids} map per precision, index 0 is precision 1
+        self._cells: List[Dict[str, Set[str]]] = [{} for _ in range(precision)]
+        self._types: Dict[str, Set[str]] = {}
+        self._type_tokens: Dict[str, frozenset] = {}  # Distinctive tokens of each type
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def _load(self) -> None:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS places (id TEXT PRIMARY KEY, data BLOB, stored_at REAL)"
+            )
+            self._conn.execute("DELETE FROM places WHERE stored_at < ?", (cutoff,))
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT data, stored_at FROM places ORDER BY stored_at"
+            ).fetchall()
+        for data, stored_at in rows:
+            self._index(PlaceFullResponse.model_validate_json(data), stored_at)
+
+    def _index(self, place: PlaceFullResponse, stored_at: float) -> None:
+        self._unindex(place.id)
+        geohash = geohash_encode(
+            place.location.latitude, place.location.longitude, self.precision
+        )
+        self._places[place.id] = (
+            stored_at, geohash, place.location.latitude, place.location.longitude, place
+        )
+        for level, cells in enumerate(self._cells, start=1):
+            cells.setdefault(geohash[:level], set()).add(place.id)
+        for place_type in place.types:
+            if place_type not in self._types:
+                self._types[place_type] = set()
+                self._type_tokens[place_type] = frozenset(tokenize(place_type) - GENERIC_TYPE_TOKENS)
+            self._types[place_type].add(place.id)
+
+    def _unindex(self, place_id: str) -> None:
+        entry = self._places.pop(place_id, None)
+        if entry is None:
+            return
+        _, geohash, _, _, place = entry
+        for level, cells in enumerate(self._cells, start=1):
+            ids = cells.get(geohash[:level])
+            if ids is not None:
+                ids.discard(place_id)
+                if not ids:
+                    del cells[geohash[:level]]
+        for place_type in place.types:
+            ids = self._types.get(place_type)
+            if ids is not None:
+                ids.discard(place_id)
+                if not ids:
+                    del self._types[place_type]
+                    del self._type_tokens[place_type]
+
+    def add(self, places: Iterable[PlaceFullResponse]) -> List[str]:
+        """Index places, replacing older copies. Places without a location are skipped.
+
+        Args:
+            places: The places.
+
+        Returns:
+            The ids of the places evicted to stay within `max_entries`.
+        """
+        now = time.time()
+        for place in places:
+            if place.location is not None:
+                self._index(place, now)
+        evicted = []
+        while len(self._places) > self.max_entries:
+            oldest_id = next(iter(self._places))
+            self._unindex(oldest_id)
+            evicted.append(oldest_id)
+        return evicted
+
+    async def aadd(self, places: List[PlaceFullResponse]) -> None:
+        """Index places and persist them off the event loop if the store has a file.
+
+        Args:
+            places: The places.
+        """
+        evicted = self.add(places)
+        if self._conn is not None:
+            await asyncio.to_thread(self._persist, places, evicted)
+
+    def _persist(self, places: List[PlaceFullResponse], evicted: List[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO places (id, data, stored_at) VALUES (?, ?, ?)",
+                [
+                    (place.id, place.model_dump_json(), now)
+                    for place in places
+                    if place.location is not None
+                ],
+            )
+            self._conn.executemany(
+                "DELETE FROM places WHERE id = ?", [(place_id,) for place_id in evicted]
+            )
+            self._conn.commit()
+
+    def _ids_near(self, center: Location, radius: float) -> Set[str]:
+        level = 1
+        for candidate in range(self.precision, 0, -1):
+            if geohash_cover_size(center, radius, candidate) <= PLACE_STORE_MAX_LOOKUP_CELLS:
+                level = candidate
+                break
+        cells = self._cells[level - 1]
+        ids = set()
+        for cell in geohash_cover(center, radius, level):
+            ids |= cells.get(cell, set())
+        return ids
+
+    def _types_named(self, query_tokens: Set[str]) -> Set[frozenset]:
+        # Generic types ("restaurant", "point_of_interest") name no type on
+        # their own, or "pizza restaurants" would match every restaurant
+        matched = {
+            tokens for tokens in self._type_tokens.values()
+            if tokens and tokens <= query_tokens
+        }
+        # "wine bars" should not also match every bar
+        return {tokens for tokens in matched if not any(tokens < other for other in matched)}
+
+    def _ids_of_types(self, query_tokens: Set[str]) -> Set[str]:
+        matched = self._types_named(query_tokens)
+        ids = set()
+        for place_type, tokens in self._type_tokens.items():
+            if tokens in matched:
+                ids |= self._types[place_type]
+        return ids
+
+    def search(self, query: str, center: Location, radius: float) -> List[PlaceFullResponse]:
+        """Find the stored places within `radius` of `center` with a type named in `query`.
+
+        Args:
+            query: The text query, e.g. "pizza restaurants".
+            center: The search center.
+            radius: The search radius in meters.
+
+        Returns:
+            The fresh matching places, closest first.
+        """
+        ids = self._ids_near(center, radius) & self._ids_of_types(tokenize(query))
+        cutoff = time.time() - self.ttl
+        entries = [self._places[place_id] for place_id in ids]
+        entries = [entry for entry in entries if entry[0] >= cutoff]
+        if not entries:
+            return []
+        latitudes = np.fromiter((entry[2] for entry in entries), np.float64, len(entries))
+        longitudes = np.fromiter((entry[3] for entry in entries), np.float64, len(entries))
+        distances = haversine_m(center.latitude, center.longitude, latitudes, longitudes)
+        order = np.argsort(distances, kind="stable")
+        return [entries[i][4] for i in order if distances[i] <= radius]
+
+    def lookup(
+        self, query: str, center: Location, radius: float, min_results: int
+    ) -> Optional[List[PlaceFullResponse]]:
+        """Answer a search locally if the store knows enough matching places.
+
+        Args:
+            query: The text query.
+            center: The search center.
+            radius: The search radius in meters.
+            min_results: The number of matches needed to answer locally.
+
+        Returns:
+            The matching places closest first, or None if the search should go
+            to Maps: the query says more than place types, as in "Joe's Pizza
+            Brooklyn" or "cheap pizza", which only Maps can match, or there
+            are fewer than `min_results` matches.
+        """
+        query_tokens = tokenize(query)
+        named = self._types_named(query_tokens)
+        if not named or not query_tokens <= GENERIC_TYPE_TOKENS.union(*named):
+            self.misses += 1
+            return None
+        places = self.search(query, center, radius)
+        if len(places) >= min_results:
+            self.hits += 1
+            return places
+        self.misses += 1
+        return None
+
+    def stats(self) -> dict:
+        """Get the local lookup counters and the current size.
+
+        Returns:
+            The store statistics.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+    def close(self) -> None:
+        """Close the SQLite file, if any."""
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+
+
+place_store = PlaceStore(path=PLACE_STORE_PATH)
@@ -0,0 +1,182 @@
+"""Speculative Maps searches, started while the search queries are generated.
+
+As soon as the search area of a chat is known, a few guessed queries are
+searched: the previous turn's queries and the place types named in the last
+user message, phrased like generated queries ("pizza restaurants"). Once the
+real queries are known, the guessed searches they match are reused and the
+others are cancelled. Even unused searches that finished have filled the
+search cache and the place store.
+"""
+import asyncio
+import re
+from typing import Dict, List
+
+from models.chat import Message
+from models.place import Location, PlaceFullResponse
+from utils.constants import SPECULATIVE_MAX_QUERIES
+from utils.maps import normalize_query, search_places
+from utils.metrics import count, span
+from utils.prefilter import GENERIC_TYPE_TOKENS, tokenize
+
+# Maps place types a chat is likely to name
+PLACE_TYPES = [
+    "american_restaurant",
+    "amusement_park",
+    "aquarium",
+    "art_gallery",
+    "bakery",
+    "bar",
+    "barbecue_restaurant",
+    "bowling_alley",
+    "brazilian_restaurant",
+    "breakfast_restaurant",
+    "brunch_restaurant",
+    "cafe",
+    "chinese_restaurant",
+    "coffee_shop",
+    "fast_food_restaurant",
+    "french_restaurant",
+    "greek_restaurant",
+    "hamburger_restaurant",
+    "ice_cream_shop",
+    "indian_restaurant",
+    "italian_restaurant",
+    "japanese_restaurant",
+    "korean_restaurant",
+    "mediterranean_restaurant",
+    "mexican_restaurant",
+    "movie_theater",
+    "museum",
+    "night_club",
+    "park",
+    "pizza_restaurant",
+    "pub",
+    "ramen_restaurant",
+    "sandwich_shop",
+    "seafood_restaurant",
+    "spa",
+    "steak_house",
+    "sushi_restaurant",
+    "thai_restaurant",
+    "vegan_restaurant",
+    "vegetarian_restaurant",
+    "vietnamese_restaurant",
+    "wine_bar",
+    "zoo",
+]
+
+# Distinctive tokens of each type, most specific types first
+_TYPE_KEYWORDS = sorted(
+    ((place_type, tokenize(place_type) - GENERIC_TYPE_TOKENS) for place_type in PLACE_TYPES),
+    key=lambda item: -len(item[1]),
+)
+
+_CONSONANT_Y = re.compile(r"[^aeiou]y$")
+
+
+def _plural(words: str) -> str:
+    if _CONSONANT_Y.search(words):
+        return words[:-1] + "ies"
+    return words + "s"
+
+
+def keyword_queries(text: str, limit: int = SPECULATIVE_MAX_QUERIES) -> List[str]:
+    """Guess queries from the place types named in a message.
+
+    Args:
+        text: The message, e.g. "somewhere with pizza, or a wine bar".
+        limit: The maximum number of queries.
+
+    Returns:
+        Queries like "pizza restaurants", most specific type first.
+    """
+    tokens = tokenize(text)
+    queries = []
+    matched: List[set] = []
+    for place_type, keywords in _TYPE_KEYWORDS:
+        if len(queries) == limit:
+            break
+        # "wine bar" should not also give "bars"
+        if keywords <= tokens and not any(keywords <= previous for previous in matched):
+            matched.append(keywords)
+            queries.append(_plural(place_type.replace("_", " ")))
+    return queries
+
+
+def speculative_queries(
+    messages: List[Message],
+    previous_queries: List[str],
+    limit: int = SPECULATIVE_MAX_QUERIES,
+) -> List[str]:
+    """Guess the search queries of a chat before the LLM generates them.
+
+    Args:
+        messages: The conversation history.
+        previous_queries: The search queries of the previous turn.
+        limit: The maximum number of queries.
+
+    Returns:
+        The previous queries, then the keyword queries of the last user
+        message, without duplicates.
+    """
+    last_message = next(
+        (message.content for message in reversed(messages) if message.role == "user"), ""
+    )
+    queries: Dict[str, str] = {}
+    for query in [*previous_queries, *keyword_queries(last_message, limit)]:
+        queries.setdefault(normalize_query(query), query)
+    return list(queries.values())[:limit]
+
+
+def _consume(task: asyncio.Task) -> None:
+    # Failures of unused searches are not worth a "never retrieved" warning
+    if not task.cancelled():
+        task.exception()
+
+
+class Prefetch:
+    """Maps searches started for guessed queries.
+
+    Must be created inside a running event loop, with the same area that the
+    real searches will use so the results can stand in for them.
+    """
+
+    def __init__(self, queries: List[str], location: Location, radius: int):
+        self.tasks: Dict[str, asyncio.Task] = {}
+        for query in queries:
+            task = asyncio.ensure_future(self._search(query, location, radius))
+            task.add_done_callback(_consume)
+            self.tasks[normalize_query(query)] = task
+
+    @staticmethod
+    async def _search(query: str, location: Location, radius: int) -> List[PlaceFullResponse]:
+        with span("prefetch"):
+            return await search_places(query, location, radius)
+
+    def take(self, queries: List[str]) -> Dict[str, asyncio.Task]:
+        """Hand over the searches matching the real queries and cancel the others.
+
+        Args:
+            queries: The real search queries.
+
+        Returns:
+            The matching searches by normalized query, to pass to
+            `utils.maps.search_places_many` as `prefetched`.
+        """
+        wanted = {normalize_query(query) for query in queries}
+        taken = {}
+        for query, task in self.tasks.items():
+            if query in wanted:
+                count("prefetch_hits")
+                taken[query] = task
+            else:
+                count("prefetch_misses")
+                task.cancel()
+        self.tasks = {}
+        return taken
+
+    def cancel(self) -> None:
+        """Cancel the searches that were not handed over."""
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks = {}
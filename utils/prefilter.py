@@ -0,0 +1,180 @@
+"""Cheap deterministic pre-ranking of candidates before LLM scoring."""
+import re
+from typing import Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+from models.place import Availability, Location, Place, PlaceFullResponse
+from utils.constants import (
+    PREFILTER_TOP_K,
+    PREFILTER_MIN_RATING_COUNT,
+    PREFILTER_EXCLUDED_STATUSES,
+    PREFILTER_WEIGHTS,
+)
+from utils.geo import distance_matrix
+
+# Place fields that can be used as hard requirements
+REQUIREMENT_FIELDS = frozenset(
+    name for name, field in Place.model_fields.items()
+    if field.annotation == Optional[Availability]
+)
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Place type words that do not identify a type on their own, as in
+# "pizza_restaurant", "coffee_shop", "steak_house" or "point_of_interest"
+GENERIC_TYPE_TOKENS = frozenset({
+    "restaurant", "shop", "house", "store", "food", "establishment", "point", "of", "interest",
+})
+
+
+def tokenize(text: str) -> Set[str]:
+    """Split text or a place type into lowercase, naively singularized tokens.
+
+    Args:
+        text: The text, e.g. "pizza restaurants" or "pizza_restaurant".
+
+    Returns:
+        The tokens.
+    """
+    tokens = set()
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.add(token)
+    return tokens
+
+
+def matches_query(place_types: Iterable[str], query_tokens: Set[str]) -> bool:
+    """Whether any of the place types is fully named in the query tokens.
+
+    Args:
+        place_types: The place types, e.g. ["pizza_restaurant", "restaurant"].
+        query_tokens: The tokens of a query.
+
+    Returns:
+        True if all tokens of at least one type appear in the query.
+    """
+    return any(tokenize(place_type) <= query_tokens for place_type in place_types)
+
+
+def is_eligible(place: PlaceFullResponse, requirements: Iterable[str]) -> bool:
+    """Apply the hard filters to a place.
+
+    Drops places that are closed, have fewer than `PREFILTER_MIN_RATING_COUNT`
+    known ratings or are known to lack one of the required attributes. Unknown
+    attributes do not disqualify a place.
+
+    Args:
+        place: The place.
+        requirements: Names of `Availability` fields that must not be FALSE.
+
+    Returns:
+        Whether the place should be kept.
+    """
+    if place.businessStatus in PREFILTER_EXCLUDED_STATUSES:
+        return False
+    if place.userRatingCount is not None and place.userRatingCount < PREFILTER_MIN_RATING_COUNT:
+        return False
+    return all(
+        getattr(place, requirement) != Availability.FALSE
+        for requirement in requirements
+        if requirement in REQUIREMENT_FIELDS
+    )
+
+
+def heuristic_scores(
+    places: List[PlaceFullResponse],
+    center: Location,
+    radius: float,
+    queries: List[str],
+    user_locations: Sequence[Location] = (),
+) -> np.ndarray:
+    """Compute a fast heuristic score for every place in one vectorized pass.
+
+    The score is a weighted sum (`PREFILTER_WEIGHTS`) of the rating out of 5,
+    the log of the rating count relative to the most rated candidate, the
+    closeness relative to `radius`, and whether a place type is named in one
+    of the queries. Closeness is measured from the users (mean distance) when
+    their locations are given, from `center` otherwise. Unknown ratings get
+    the candidates' mean.
+
+    Args:
+        places: The candidate places.
+        center: The search center.
+        radius: The search radius in meters.
+        queries: The search queries.
+        user_locations: The user locations.
+
+    Returns:
+        The (N,) heuristic scores.
+    """
+    ratings = np.array(
+        [place.rating if place.rating is not None else np.nan for place in places],
+        dtype=np.float64,
+    )
+    rating_score = ratings / 5.0
+    if np.isnan(rating_score).all():
+        rating_score = np.full(len(places), 0.5)
+    else:
+        rating_score = np.where(np.isnan(rating_score), np.nanmean(rating_score), rating_score)
+
+    log_counts = np.log1p(
+        np.array([place.userRatingCount or 0 for place in places], dtype=np.float64)
+    )
+    count_score = log_counts / log_counts.max() if log_counts.max() > 0 else np.zeros(len(places))
+
+    place_locations = [place.location or center for place in places]
+    origins = list(user_locations) or [center]
+    distances = distance_matrix(origins, place_locations).mean(axis=0)
+    distance_score = 1.0 - np.clip(distances / radius, 0.0, 1.0)
+
+    query_tokens = [tokenize(query) for query in queries]
+    type_score = np.array(
+        [
+            float(any(matches_query(place.types, tokens) for tokens in query_tokens))
+            for place in places
+        ]
+    )
+
+    return (
+        PREFILTER_WEIGHTS["rating"] * rating_score
+        + PREFILTER_WEIGHTS["rating_count"] * count_score
+        + PREFILTER_WEIGHTS["distance"] * distance_score
+        + PREFILTER_WEIGHTS["type_match"] * type_score
+    )
+
+
+def prefilter_places(
+    places: List[PlaceFullResponse],
+    center: Location,
+    radius: float,
+    queries: List[str],
+    requirements: Iterable[str] = (),
+    top_k: Optional[int] = None,
+    user_locations: Sequence[Location] = (),
+) -> List[PlaceFullResponse]:
+    """Filter the candidates and keep the top-K by heuristic score.
+
+    Args:
+        places: The candidate places.
+        center: The search center.
+        radius: The search radius in meters.
+        queries: The search queries.
+        requirements: Names of `Availability` fields that must not be FALSE.
+        top_k: The number of places to keep, defaults to `PREFILTER_TOP_K`.
+        user_locations: The user locations, for the distance of each place.
+
+    Returns:
+        The kept places, best heuristic score first.
+    """
+    top_k = PREFILTER_TOP_K if top_k is None else top_k
+    requirements = list(requirements)
+    eligible = [place for place in places if is_eligible(place, requirements)]
+    if not eligible:
+        return []
+
+    scores = heuristic_scores(eligible, center, radius, queries, user_locations)
+    # Stable sort so ties keep the search order
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return [eligible[i] for i in order]
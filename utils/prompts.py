@@ -28,10 +28,10 @@ Conversation History:
 Search Queries:
 {search_queries}
 
-Places:
+Places (one row per place, "-" means unknown):
 {places}
 
-Final Scores:
+Final Scores (place id=score, best first):
 {final_scores}
 
 Here is an example of the format you should follow:
@@ -40,14 +40,18 @@ I recommended Joe's Pizza because you guys mentioned you wanted something cheap
 In your response, ONLY RESPOND WITH THE JUSTIFICATION, NOTHING ELSE.
 """
 
-SCORING_PROMPT = """
+# The scoring prompt is split so the part shared by every place of a request
+# can be registered once with the context cache (see `utils.context_cache`).
+SCORING_PREFIX_PROMPT = """
 Based on the conversation history and the place's details, return the place's score for each of the criteria (0-1) float. If there is a criteria that is not directly EXPLICITLY inferred from the conversation history, return -1 for that criteria.
 
 Conversation History:
 {conversation_history}
+"""
 
-Place Details:
-{place_details} 
+SCORING_PLACE_PROMPT = """
+Place Details (unknown fields are left out):
+{place_details}
 """
 
 FINAL_SCORING_PROMPT = """
@@ -56,9 +60,59 @@ Based on the conversation history, place details and the place's scores, return
 Conversation History:
 {conversation_history}
 
-Place Details:
+Place Details (unknown fields are left out):
 {place_details}
 
-Place Scores:
+Place Scores (criteria that were not mentioned are left out):
 {place_scores}
 """
+
+BATCH_SCORING_PROMPT = """
+Based on the conversation history and the table of places, return a score for EVERY place in the table.
+For each place, return the place's score for each of the criteria (0-1) float. If there is a criteria that is not directly EXPLICITLY inferred from the conversation history, return -1 for that criteria.
+Then also return the final score (0-1) float for the place in the "score" field, based on the conversation history, place details and the place's criteria scores.
+Use the "id" column of the table EXACTLY as the "id" of each returned place.
+
+Conversation History:
+{conversation_history}
+
+Places (one row per place, "-" means unknown, columns unknown for every place are left out):
+{places_table}
+"""
+
+PREFERENCE_SUMMARY_PROMPT = """
+Summarize the conversation history of multiple users into the preferences that matter for choosing a place.
+List every preference, constraint and dealbreaker that is EXPLICITLY stated, with who stated it (e.g. "Dan: vegetarian"). Keep budget, location, timing, group size, food, atmosphere and accessibility details.
+Do NOT add preferences that are not explicitly stated. Be concise, one short line per preference.
+
+Conversation History:
+{conversation_history}
+
+In your response, ONLY RESPOND WITH THE SUMMARY, NOTHING ELSE.
+"""
+
+AFFECTED_CRITERIA_PROMPT = """
+The places for a group of users were scored on the following criteria, based on their conversation history: {criteria}.
+Based on the new messages of the conversation, return the criteria whose scores may change. Return an empty list if the new messages do not change what the users want from a place.
+
+Conversation History:
+{conversation_history}
+
+New Messages:
+{new_messages}
+"""
+
+RESCORING_PROMPT = """
+Based on the conversation history, the new messages and the table of places, return new scores for EVERY place in the table, only for these criteria: {criteria}.
+Return each score as a (0-1) float. If a criteria is not directly EXPLICITLY inferred from the conversation history or the new messages, return -1 for that criteria.
+Use the "id" column of the table EXACTLY as the "id" of each returned place.
+
+Conversation History:
+{conversation_history}
+
+New Messages:
+{new_messages}
+
+Places (one row per place, "-" means unknown, columns unknown for every place are left out):
+{places_table}
+"""
@@ -0,0 +1,269 @@
+"""Rendering of places into compact prompt text."""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from models.place import Availability, Place, PlaceRanking, UserPreferences
+
+_AVAILABILITY_FLAGS = {
+    Availability.TRUE: "yes",
+    Availability.FALSE: "no",
+    Availability.NOT_AVAILABLE: "-",
+}
+
+_AVAILABILITY_COLUMNS = [
+    "goodForChildren",
+    "goodForGroups",
+    "liveMusic",
+    "allowedDogs",
+    "outdoorSeating",
+    "parkingOptions",
+    "dineIn",
+    "delivery",
+    "reservable",
+]
+
+PLACES_TABLE_COLUMNS = [
+    "id",
+    "displayName",
+    "location",
+    "rating",
+    "userRatingCount",
+    "types",
+    "currentOpeningHours",
+    *_AVAILABILITY_COLUMNS,
+    "priceLevel",
+    "priceRange",
+]
+
+_DAYS = {
+    "monday": "Mo",
+    "tuesday": "Tu",
+    "wednesday": "We",
+    "thursday": "Th",
+    "friday": "Fr",
+    "saturday": "Sa",
+    "sunday": "Su",
+}
+
+_TIME = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*([AP]M)?$", re.IGNORECASE)
+_RANGE_SEPARATOR = re.compile(r"\s*[–—-]\s*")
+
+
+def _parse_time(text: str) -> Optional[Tuple[int, int, Optional[str]]]:
+    match = _TIME.match(text.strip())
+    if match is None:
+        return None
+    hour, minute, meridiem = match.groups()
+    return int(hour), int(minute or 0), meridiem.upper() if meridiem else None
+
+
+def _format_time(hour: int, minute: int, meridiem: Optional[str], closing: bool) -> str:
+    if meridiem == "AM" and hour == 12:
+        hour = 0
+    elif meridiem == "PM" and hour != 12:
+        hour += 12
+    if closing and hour == 0 and minute == 0:
+        hour = 24
+    return f"{hour}" if minute == 0 else f"{hour}:{minute:02d}"
+
+
+def _abbreviate_range(text: str) -> Optional[str]:
+    """Turn "11:30 AM – 2:30 PM" (or "5:00 – 10:00 PM") into "11:30-14:30"."""
+    bounds = _RANGE_SEPARATOR.split(text.strip())
+    if len(bounds) != 2:
+        return None
+    start, end = _parse_time(bounds[0]), _parse_time(bounds[1])
+    if start is None or end is None:
+        return None
+    # Google leaves out the start's AM/PM when it is the same as the end's
+    start_meridiem = start[2] or end[2]
+    return (
+        f"{_format_time(start[0], start[1], start_meridiem, closing=False)}"
+        f"-{_format_time(end[0], end[1], end[2], closing=True)}"
+    )
+
+
+def _abbreviate_day(hours: str) -> str:
+    # Maps uses narrow no-break and thin spaces around times
+    normalized = " ".join(hours.replace("\u202f", " ").replace("\u2009", " ").split())
+    lowered = normalized.lower()
+    if lowered == "closed":
+        return "closed"
+    if lowered == "open 24 hours":
+        return "24h"
+    ranges = [_abbreviate_range(part) for part in normalized.split(",")]
+    if any(part is None for part in ranges):
+        return normalized
+    return ",".join(ranges)
+
+
+def abbreviate_opening_hours(weekday_descriptions: List[str]) -> Optional[str]:
+    """Abbreviate Maps `weekdayDescriptions`, merging runs of days with the same hours.
+
+    For example "Monday: 9:00 AM – 5:00 PM" through "Friday: ..." and
+    "Saturday: Closed" become "Mo-Fr 9-17; Sa closed". Lines that cannot be
+    parsed keep their text.
+
+    Args:
+        weekday_descriptions: The per-day opening hours.
+
+    Returns:
+        The abbreviated hours, or None if there are none.
+    """
+    days = []
+    for line in weekday_descriptions:
+        day, separator, hours = line.partition(":")
+        if separator and day.strip().lower() in _DAYS:
+            days.append((_DAYS[day.strip().lower()], _abbreviate_day(hours)))
+        else:
+            days.append((None, " ".join(line.split())))
+    if not days:
+        return None
+
+    groups: List[list] = []  # [first day, last day, hours]
+    for day, hours in days:
+        if day is not None and groups and groups[-1][2] == hours and groups[-1][0] is not None:
+            groups[-1][1] = day
+        else:
+            groups.append([day, day, hours])
+    return "; ".join(
+        hours if first is None
+        else f"{first} {hours}" if first == last
+        else f"{first}-{last} {hours}"
+        for first, last, hours in groups
+    )
+
+
+def _price_range(place: Place) -> Optional[str]:
+    if place.priceRange and (place.priceRange.startPrice or place.priceRange.endPrice):
+        return f"{place.priceRange.startPrice or '?'} - {place.priceRange.endPrice or '?'}"
+    return None
+
+
+def _price_level(place: Place) -> Optional[str]:
+    if place.priceLevel is None or place.priceLevel == "PRICE_LEVEL_UNSPECIFIED":
+        return None
+    return place.priceLevel.removeprefix("PRICE_LEVEL_")
+
+
+def _number(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return str(int(value)) if float(value).is_integer() else str(value)
+
+
+def place_cells(place: Place) -> Dict[str, Optional[str]]:
+    """Get the rendered value of every table column of a place, None if unknown.
+
+    Args:
+        place: The place.
+
+    Returns:
+        The cell texts by column, in `PLACES_TABLE_COLUMNS` order.
+    """
+    cells = {
+        "id": place.id,
+        "displayName": place.displayName,
+        "location": (
+            f"{place.location.latitude:.5f},{place.location.longitude:.5f}"
+            if place.location
+            else None
+        ),
+        "rating": _number(place.rating),
+        "userRatingCount": _number(place.userRatingCount),
+        "types": ",".join(place.types) or None,
+        "currentOpeningHours": abbreviate_opening_hours(place.currentOpeningHours),
+    }
+    for column in _AVAILABILITY_COLUMNS:
+        value = getattr(place, column)
+        cells[column] = None if value in (None, Availability.NOT_AVAILABLE) else _AVAILABILITY_FLAGS[value]
+    cells["priceLevel"] = _price_level(place)
+    cells["priceRange"] = _price_range(place)
+    return cells
+
+
+def _cell(value) -> str:
+    """Render a single table cell, keeping the row on one line."""
+    if value is None:
+        return "-"
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def render_place_row(place: Place, columns: List[str] = PLACES_TABLE_COLUMNS) -> str:
+    """Render a place as one pipe-separated table row.
+
+    Args:
+        place: The place to render.
+        columns: The columns to render.
+
+    Returns:
+        The table row, with cells in `columns` order.
+    """
+    cells = place_cells(place)
+    return " | ".join(_cell(cells[column]) for column in columns)
+
+
+def render_places_table(places: List[Place]) -> str:
+    """Render places as a compact pipe-separated table with a header row.
+
+    Columns that are unknown for every place are left out.
+
+    Args:
+        places: The places to render.
+
+    Returns:
+        The table text.
+    """
+    rows_cells = [place_cells(place) for place in places]
+    columns = [
+        column for column in PLACES_TABLE_COLUMNS
+        if column == "id" or any(cells[column] is not None for cells in rows_cells)
+    ]
+    rows = [" | ".join(columns)]
+    rows.extend(" | ".join(_cell(cells[column]) for column in columns) for cells in rows_cells)
+    return "\n".join(rows)
+
+
+def render_place(place: Place) -> str:
+    """Render a place as one line of `column: value` pairs, leaving out unknown fields.
+
+    Args:
+        place: The place to render.
+
+    Returns:
+        The place text.
+    """
+    cells = place_cells(place)
+    return "; ".join(
+        f"{column}: {_cell(value)}" for column, value in cells.items() if value is not None
+    )
+
+
+def render_place_scores(place_score: PlaceRanking) -> str:
+    """Render the criteria scores of a place, leaving out the unmentioned (-1) ones.
+
+    Args:
+        place_score: The criteria scores.
+
+    Returns:
+        The scores as `criterion=score` pairs, or "none mentioned".
+    """
+    scores = [
+        f"{name}={value:g}"
+        for name, value in place_score.model_dump(exclude={"id"}).items()
+        if isinstance(value, (int, float)) and value >= 0
+    ]
+    return ", ".join(scores) or "none mentioned"
+
+
+def render_final_scores(user_preferences: List[UserPreferences]) -> str:
+    """Render final scores as `place_id=score` pairs, best first.
+
+    Args:
+        user_preferences: The final scores.
+
+    Returns:
+        The scores text.
+    """
+    ranked = sorted(user_preferences, key=lambda preference: preference.score, reverse=True)
+    return ", ".join(f"{preference.place_id}={preference.score:.2f}" for preference in ranked)
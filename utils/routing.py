@@ -0,0 +1,319 @@
+"""Multi-stop route planning on a cached travel matrix.
+
+Travel costs come from a `MatrixBackend`. The default `HaversineBackend` is a
+local stand-in for road-network travel: great-circle distances stretched by a
+detour factor, at an average speed per travel mode. A backend for a routing
+API only has to implement `matrix`. Matrices are cached per set of points, so
+planning again for the same users and places, in any order, reuses them.
+
+Stop orders are built by nearest neighbour and improved with 2-opt and Or-opt
+moves on travel time. All routes are paths with a fixed start and an optional
+fixed end; a round trip is a path that ends where it starts.
+"""
+import hashlib
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.chat import Location
+from models.route import RoutePlan, RouteStop, StopKind, TravelMode
+from utils.cache import MemoryCache
+from utils.constants import (
+    ROUTE_SPEEDS_MPS,
+    ROUTE_DETOUR_FACTOR,
+    ROUTE_MATRIX_CACHE_TTL_SECONDS,
+    ROUTE_MATRIX_CACHE_MAX_ENTRIES,
+    ROUTE_MAX_MOVES,
+)
+from utils.geo import coordinates, distance_matrix
+from utils.metrics import count
+
+# Segment lengths moved by Or-opt
+OR_OPT_SEGMENT_LENGTHS = (1, 2, 3)
+
+
+class MatrixBackend(ABC):
+    """Source of the travel distances and durations between points."""
+
+    name: str
+
+    @abstractmethod
+    async def matrix(
+        self, locations: List[Location], mode: TravelMode
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the travel matrices between every pair of points.
+
+        Args:
+            locations: The points.
+            mode: The travel mode.
+
+        Returns:
+            The (N, N) distances in meters and durations in seconds, from row
+            to column.
+        """
+
+
+class HaversineBackend(MatrixBackend):
+    """Local stand-in for road-network travel, from great-circle distances."""
+
+    name = "haversine"
+
+    def __init__(self, detour_factor: float = ROUTE_DETOUR_FACTOR, speeds: dict = ROUTE_SPEEDS_MPS):
+        self.detour_factor = detour_factor
+        self.speeds = speeds
+
+    async def matrix(
+        self, locations: List[Location], mode: TravelMode
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        distances = distance_matrix(locations, locations) * self.detour_factor
+        return distances, distances / self.speeds[mode.value]
+
+
+matrix_backend: MatrixBackend = HaversineBackend()
+matrix_cache = MemoryCache(ttl=ROUTE_MATRIX_CACHE_TTL_SECONDS, max_entries=ROUTE_MATRIX_CACHE_MAX_ENTRIES)
+
+
+def _canonical_order(locations: List[Location]) -> np.ndarray:
+    """Order points by rounded coordinates, so any permutation of a set maps to one key."""
+    latitudes, longitudes = coordinates(locations)
+    return np.lexsort((longitudes.round(6), latitudes.round(6)))
+
+
+def matrix_cache_key(locations: List[Location], mode: TravelMode, backend: MatrixBackend) -> str:
+    """Build the cache key of the travel matrix of a set of points.
+
+    Args:
+        locations: The points, in canonical order.
+        mode: The travel mode.
+        backend: The matrix backend.
+
+    Returns:
+        The cache key.
+    """
+    points = ";".join(f"{location.latitude:.6f},{location.longitude:.6f}" for location in locations)
+    return hashlib.sha256(f"{backend.name}|{mode.value}|{points}".encode()).hexdigest()
+
+
+async def travel_matrix(
+    locations: List[Location],
+    mode: TravelMode,
+    backend: Optional[MatrixBackend] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the travel matrices of points, going through the matrix cache.
+
+    Args:
+        locations: The points.
+        mode: The travel mode.
+        backend: The matrix backend, defaults to `matrix_backend`.
+
+    Returns:
+        The (N, N) distances in meters and durations in seconds, in the order
+        of `locations`.
+    """
+    backend = backend or matrix_backend
+    order = _canonical_order(locations)
+    canonical = [locations[i] for i in order]
+    key = matrix_cache_key(canonical, mode, backend)
+    matrices = await matrix_cache.aget(key)
+    if matrices is None:
+        count("route_matrix_cache_misses")
+        matrices = await backend.matrix(canonical, mode)
+        await matrix_cache.aset(key, matrices)
+    else:
+        count("route_matrix_cache_hits")
+
+    # Back from the canonical order to the order of `locations`
+    inverse = np.empty_like(order)
+    inverse[order] = np.arange(len(order))
+    index = np.ix_(inverse, inverse)
+    return matrices[0][index], matrices[1][index]
+
+
+def path_cost(cost: np.ndarray, path: Sequence[int]) -> float:
+    """Total cost of the consecutive legs of a path.
+
+    Args:
+        cost: The (N, N) cost matrix.
+        path: The node indices, in visiting order.
+
+    Returns:
+        The summed cost.
+    """
+    path = np.asarray(path)
+    return float(cost[path[:-1], path[1:]].sum())
+
+
+def nearest_neighbor(
+    cost: np.ndarray, start: int, nodes: Sequence[int], end: Optional[int] = None
+) -> List[int]:
+    """Build a path by always going to the cheapest unvisited node.
+
+    Args:
+        cost: The (N, N) cost matrix.
+        start: The first node.
+        nodes: The nodes to visit, without `start` and `end`.
+        end: The last node, if fixed.
+
+    Returns:
+        The path.
+    """
+    path = [start]
+    remaining = np.asarray(nodes, dtype=np.intp)
+    while remaining.size:
+        position = int(np.argmin(cost[path[-1], remaining]))
+        path.append(int(remaining[position]))
+        remaining = np.delete(remaining, position)
+    if end is not None:
+        path.append(end)
+    return path
+
+
+def _two_opt_move(cost: np.ndarray, path: List[int], fixed_end: bool) -> bool:
+    """Apply the best improving segment reversal, if any."""
+    n = len(path)
+    last = n - 2 if fixed_end else n - 1
+    if last - 1 < 1:
+        return False
+    p = np.asarray(path)
+    forward = np.concatenate(([0.0], np.cumsum(cost[p[:-1], p[1:]])))
+    backward = np.concatenate(([0.0], np.cumsum(cost[p[1:], p[:-1]])))
+    i, j = np.triu_indices(last + 1, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+
+    # Reversing path[i..j]: new edges at both ends, the inside runs backwards
+    before = cost[p[i - 1], p[i]] + forward[j] - forward[i]
+    after = cost[p[i - 1], p[j]] + backward[j] - backward[i]
+    has_next = j + 1 < n
+    following = p[np.minimum(j + 1, n - 1)]
+    before = before + np.where(has_next, cost[p[j], following], 0.0)
+    after = after + np.where(has_next, cost[p[i], following], 0.0)
+    delta = after - before
+
+    best = int(np.argmin(delta))
+    if delta[best] >= -1e-9:
+        return False
+    start, stop = int(i[best]), int(j[best])
+    path[start : stop + 1] = path[start : stop + 1][::-1]
+    return True
+
+
+def _or_opt_move(cost: np.ndarray, path: List[int], fixed_end: bool) -> bool:
+    """Apply the best improving move of a short segment elsewhere, if any."""
+    n = len(path)
+    last = n - 2 if fixed_end else n - 1
+    p = np.asarray(path)
+    best_delta, best_move = -1e-9, None
+    for length in OR_OPT_SEGMENT_LENGTHS:
+        for i in range(1, last - length + 2):
+            e = i + length - 1
+            # Gain of taking path[i..e] out
+            removed = cost[p[i - 1], p[i]]
+            if e + 1 < n:
+                removed += cost[p[e], p[e + 1]] - cost[p[i - 1], p[e + 1]]
+            # Cost of putting it between path[k] and path[k + 1], or at the end
+            k = np.concatenate((np.arange(0, i - 1), np.arange(e + 1, n - 1 if fixed_end else n)))
+            if not k.size:
+                continue
+            has_next = k + 1 < n
+            following = p[np.minimum(k + 1, n - 1)]
+            added = cost[p[k], p[i]] + np.where(
+                has_next, cost[p[e], following] - cost[p[k], following], 0.0
+            )
+            position = int(np.argmin(added))
+            delta = added[position] - removed
+            if delta < best_delta:
+                best_delta, best_move = delta, (i, e, int(k[position]))
+    if best_move is None:
+        return False
+    i, e, k = best_move
+    segment = path[i : e + 1]
+    rest = path[:i] + path[e + 1 :]
+    position = k + 1 if k < i else k + 1 - len(segment)
+    path[:] = rest[:position] + segment + rest[position:]
+    return True
+
+
+def improve_path(
+    cost: np.ndarray, path: List[int], fixed_end: bool, max_moves: int = ROUTE_MAX_MOVES
+) -> List[int]:
+    """Improve a path with 2-opt and Or-opt moves until neither finds a gain.
+
+    The first node, and the last one if `fixed_end`, stay in place.
+
+    Args:
+        cost: The (N, N) cost matrix, not necessarily symmetric.
+        path: The path to improve.
+        fixed_end: Whether the last node is fixed.
+        max_moves: Cap on the improving moves applied.
+
+    Returns:
+        The improved path.
+    """
+    path = list(path)
+    for _ in range(max_moves):
+        if not (_two_opt_move(cost, path, fixed_end) or _or_opt_move(cost, path, fixed_end)):
+            break
+    return path
+
+
+def plan_path(
+    cost: np.ndarray,
+    start: int,
+    nodes: Sequence[int],
+    end: Optional[int] = None,
+    max_moves: int = ROUTE_MAX_MOVES,
+) -> List[int]:
+    """Plan the cheapest found path from `start` through `nodes`.
+
+    Args:
+        cost: The (N, N) cost matrix.
+        start: The first node.
+        nodes: The nodes to visit, without `start` and `end`.
+        end: The last node, if fixed. May be `start` for a round trip.
+        max_moves: Cap on the improving moves applied.
+
+    Returns:
+        The path, starting with `start` and ending with `end` if given.
+    """
+    path = nearest_neighbor(cost, start, nodes, end)
+    return improve_path(cost, path, fixed_end=end is not None, max_moves=max_moves)
+
+
+def build_plan(
+    path: Sequence[int],
+    distances: np.ndarray,
+    durations: np.ndarray,
+    stops: List[Tuple[str, StopKind, str, Location]],
+) -> RoutePlan:
+    """Turn a path into a route plan with cumulative distances and times.
+
+    Args:
+        path: The node indices, in visiting order.
+        distances: The (N, N) distances in meters.
+        durations: The (N, N) durations in seconds.
+        stops: The (id, kind, name, location) of every node.
+
+    Returns:
+        The route plan.
+    """
+    path = np.asarray(path, dtype=np.intp)
+    leg_distances = np.concatenate(([0.0], np.cumsum(distances[path[:-1], path[1:]])))
+    leg_durations = np.concatenate(([0.0], np.cumsum(durations[path[:-1], path[1:]])))
+    route_stops = []
+    for node, distance, duration in zip(path, leg_distances, leg_durations):
+        stop_id, kind, name, location = stops[node]
+        route_stops.append(RouteStop(
+            id=stop_id,
+            kind=kind,
+            name=name,
+            location=location,
+            arrivalSeconds=round(float(duration), 1),
+            distanceMeters=round(float(distance), 1),
+        ))
+    return RoutePlan(
+        stops=route_stops,
+        distanceMeters=round(float(leg_distances[-1]), 1),
+        durationSeconds=round(float(leg_durations[-1]), 1),
+    )
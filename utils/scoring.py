@@ -0,0 +1,234 @@
+"""Local, deterministic scoring of ranked places, and the LLM score cache and
+single-flight."""
+import hashlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+from pydantic import BaseModel, Field, create_model
+
+from models.chat import Location, Message
+from models.place import Place, PlaceRanking, UserPreferences
+from utils.cache import MemoryCache
+from utils.geo import distance_matrix, fairness_metrics, fairness_scores
+from utils.singleflight import SingleFlight
+from utils.constants import (
+    CRITERIA_WEIGHTS,
+    NEUTRAL_SCORE,
+    FAIRNESS_REFERENCE_FACTOR,
+    SCORE_CACHE_TTL_SECONDS,
+    SCORE_CACHE_MAX_ENTRIES,
+)
+
+# Criteria scored by the LLM, in a fixed column order
+CRITERIA = [name for name in PlaceRanking.model_fields if name != "id"]
+
+
+def rankings_matrix(rankings: List[PlaceRanking]) -> np.ndarray:
+    """Stack the criteria scores of the rankings into an (N, C) matrix.
+
+    Args:
+        rankings: The per-place criteria scores.
+
+    Returns:
+        The score matrix, with columns in `CRITERIA` order.
+    """
+    if not rankings:
+        return np.empty((0, len(CRITERIA)), dtype=np.float64)
+    return np.array(
+        [[getattr(ranking, name) for name in CRITERIA] for ranking in rankings],
+        dtype=np.float64,
+    )
+
+
+def weights_vector(weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Build the per-criterion weight vector.
+
+    Args:
+        weights: Weights by criterion name. Missing criteria get weight 1.
+
+    Returns:
+        The weight vector, in `CRITERIA` order.
+    """
+    weights = CRITERIA_WEIGHTS if weights is None else weights
+    return np.array([weights.get(name, 1.0) for name in CRITERIA], dtype=np.float64)
+
+
+def combine_scores(
+    scores: np.ndarray,
+    weights: np.ndarray,
+    default_score: float = NEUTRAL_SCORE,
+) -> np.ndarray:
+    """Combine criteria scores into one final score per place.
+
+    The final score is the weighted mean over the criteria that were mentioned
+    in the conversation. Negative scores (-1) mean "not mentioned" and are
+    left out of both the numerator and the denominator. Places with no
+    mentioned criteria get `default_score`.
+
+    Args:
+        scores: The (N, C) criteria score matrix.
+        weights: The (C,) weight vector.
+        default_score: The score for places with no mentioned criteria.
+
+    Returns:
+        The (N,) final scores in [0, 1].
+    """
+    mentioned = scores >= 0
+    masked_weights = np.where(mentioned, weights, 0.0)
+    total_weight = masked_weights.sum(axis=1)
+    weighted_sum = (np.where(mentioned, scores, 0.0) * masked_weights).sum(axis=1)
+    final = np.divide(
+        weighted_sum,
+        total_weight,
+        out=np.full(scores.shape[0], default_score, dtype=np.float64),
+        where=total_weight > 0,
+    )
+    return np.clip(final, 0.0, 1.0)
+
+
+def final_scores(
+    rankings: List[PlaceRanking],
+    weights: Optional[Dict[str, float]] = None,
+    location_scores: Optional[Dict[str, float]] = None,
+) -> List[UserPreferences]:
+    """Compute the final score of every ranked place in one vectorized pass.
+
+    Args:
+        rankings: The per-place criteria scores.
+        weights: Weights by criterion name, defaults to `CRITERIA_WEIGHTS`.
+        location_scores: Location scores by place id (see `location_scores`)
+            that replace the LLM's `location` score of those places.
+
+    Returns:
+        The user preferences, in the same order as `rankings`.
+    """
+    matrix = rankings_matrix(rankings)
+    if location_scores:
+        column = CRITERIA.index("location")
+        for row, ranking in enumerate(rankings):
+            if ranking.id in location_scores:
+                matrix[row, column] = location_scores[ranking.id]
+    scores = combine_scores(matrix, weights_vector(weights))
+    return [
+        UserPreferences(place_id=ranking.id, score=float(score))
+        for ranking, score in zip(rankings, scores)
+    ]
+
+
+def location_scores(
+    places: List[Place], user_locations: List[Location], radius: float
+) -> Dict[str, float]:
+    """Score how fair the trip to each place is for the group.
+
+    Computed from the users x places distance matrix (see
+    `utils.geo.fairness_scores`), so the location criterion reflects the
+    actual travel of every user instead of the LLM's guess.
+
+    Args:
+        places: The places. Places without a location are left out.
+        user_locations: The user locations.
+        radius: The search radius in meters, scaled by
+            `FAIRNESS_REFERENCE_FACTOR` into the distance scoring 0.
+
+    Returns:
+        The location scores in [0, 1], by place id.
+    """
+    located = [place for place in places if place.location is not None]
+    if not located or not user_locations:
+        return {}
+    distances = distance_matrix(user_locations, [place.location for place in located])
+    scores = fairness_scores(fairness_metrics(distances), FAIRNESS_REFERENCE_FACTOR * radius)
+    return {place.id: float(score) for place, score in zip(located, scores)}
+
+
+@lru_cache(maxsize=None)
+def partial_ranking_model(criteria: Tuple[str, ...]) -> Type[BaseModel]:
+    """Get a `PlaceRanking` schema restricted to some criteria.
+
+    Args:
+        criteria: The criteria names, in `CRITERIA`.
+
+    Returns:
+        A model with the `id` and the score fields of `criteria`.
+    """
+    return create_model(
+        "PartialPlaceRanking",
+        id=(str, ...),
+        **{name: (float, Field(ge=-1, le=1.0)) for name in criteria},
+    )
+
+
+# Fields of `Place`, the only ones the scoring prompts see
+_PLACE_FIELDS = set(Place.model_fields)
+
+
+score_cache = MemoryCache(ttl=SCORE_CACHE_TTL_SECONDS, max_entries=SCORE_CACHE_MAX_ENTRIES)
+# Scoring calls in flight, by score cache key (per place) or tuple of keys (per batch)
+score_flight = SingleFlight("score")
+
+
+def conversation_fingerprint(messages: List[Message]) -> str:
+    """Hash the preference signal of a conversation.
+
+    Messages are normalized for case and whitespace, so a client re-sending
+    the same conversation maps to the same fingerprint.
+
+    Args:
+        messages: The conversation history.
+
+    Returns:
+        The conversation fingerprint.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.role.encode())
+        digest.update(b"\x1f")
+        digest.update(" ".join(message.content.lower().split()).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def history_fingerprint(history: str) -> str:
+    """Hash the conversation text a scoring prompt reads.
+
+    Scores are cached by this rather than by the messages: a follow-up turn
+    that leaves the preference summary of a long conversation unchanged (see
+    `utils.conversation.scoring_conversation`) reuses the scores of the
+    previous turn. Conversations short enough to be sent as is only hit on
+    the same history, up to case and whitespace.
+
+    Args:
+        history: The conversation history or its preference summary.
+
+    Returns:
+        The history fingerprint.
+    """
+    return hashlib.sha256(" ".join(history.lower().split()).encode()).hexdigest()
+
+
+def place_fingerprint(place: Place) -> str:
+    """Hash the fields of a place that the scoring prompts see.
+
+    Args:
+        place: The place.
+
+    Returns:
+        The place fingerprint.
+    """
+    return hashlib.sha256(place.model_dump_json(include=_PLACE_FIELDS).encode()).hexdigest()
+
+
+def score_cache_key(place: Place, conversation: str, model: str) -> str:
+    """Build the score cache key of a place.
+
+    Args:
+        place: The place.
+        conversation: The fingerprint of the conversation text the scoring
+            prompt reads (see `history_fingerprint`).
+        model: The scoring model name.
+
+    Returns:
+        The cache key.
+    """
+    return f"{place.id}|{place_fingerprint(place)}|{conversation}|{model}"
@@ -0,0 +1,130 @@
+"""Per-conversation ranking state, kept between the turns of a chat.
+
+A turn with a `conversationId` stores its queries, its running top places and
+their criteria scores. The next turn of the same conversation, in the same
+search area, is a follow-up: it only searches the queries not searched yet,
+re-scores the criteria its new messages affect and merges the new places into
+the running top (see `routers.places.rerank_follow_up`).
+"""
+from typing import Dict, List, Optional
+
+from pydantic import TypeAdapter
+
+from models.chat import Message
+from models.place import Location, PlaceFullResponse, PlaceRanking, Session, UserPreferences
+from utils.cache import CacheBackend, MemoryCache, SQLiteCache
+from utils.constants import (
+    SESSION_TOP_K,
+    SESSION_TTL_SECONDS,
+    SESSION_MAX_ENTRIES,
+    SESSION_STORE_PATH,
+    SESSION_MAX_AREA_CHANGE,
+)
+from utils.geo import haversine_m
+from utils.maps import normalize_query
+from utils.scoring import conversation_fingerprint
+
+
+def _make_session_store() -> CacheBackend:
+    """Create the session store, on disk if `SESSION_STORE_PATH` is set."""
+    if SESSION_STORE_PATH:
+        adapter = TypeAdapter(Session)
+        return SQLiteCache(
+            SESSION_STORE_PATH,
+            ttl=SESSION_TTL_SECONDS,
+            max_entries=SESSION_MAX_ENTRIES,
+            dumps=adapter.dump_json,
+            loads=adapter.validate_json,
+        )
+    return MemoryCache(ttl=SESSION_TTL_SECONDS, max_entries=SESSION_MAX_ENTRIES)
+
+
+session_store = _make_session_store()
+
+
+def is_follow_up(
+    session: Session, messages: List[Message], location: Location, radius: int
+) -> bool:
+    """Whether a turn continues the conversation of a session in the same area.
+
+    Args:
+        session: The stored session.
+        messages: The messages of the turn.
+        location: The search center of the turn.
+        radius: The search radius of the turn, in meters.
+
+    Returns:
+        True if `messages` extend the session's messages and the search area
+        moved by at most `SESSION_MAX_AREA_CHANGE` of the radius.
+    """
+    known = len(session.messages)
+    if len(messages) <= known:
+        return False
+    if conversation_fingerprint(messages[:known]) != conversation_fingerprint(session.messages):
+        return False
+    tolerance = SESSION_MAX_AREA_CHANGE * session.searchRadius
+    shift = haversine_m(
+        session.location.latitude, session.location.longitude, location.latitude, location.longitude
+    )
+    return shift <= tolerance and abs(radius - session.searchRadius) <= tolerance
+
+
+def new_queries(session: Session, queries: List[str]) -> List[str]:
+    """Get the queries of a turn that the session has not searched yet.
+
+    Args:
+        session: The stored session.
+        queries: The queries of the turn.
+
+    Returns:
+        The queries not searched yet, in order.
+    """
+    searched = {normalize_query(query) for query in session.queries}
+    return [query for query in queries if normalize_query(query) not in searched]
+
+
+def build_session(
+    messages: List[Message],
+    queries: List[str],
+    location: Location,
+    radius: int,
+    places: List[PlaceFullResponse],
+    user_preferences: List[UserPreferences],
+    rankings: Dict[str, PlaceRanking],
+    previous: Optional[Session] = None,
+) -> Session:
+    """Build the session of a finished turn, keeping the top `SESSION_TOP_K` places.
+
+    Args:
+        messages: The messages of the turn.
+        queries: The queries of the turn.
+        location: The search center of the turn.
+        radius: The search radius of the turn.
+        places: The ranked places.
+        user_preferences: The final scores of the places.
+        rankings: The criteria scores by place id. Places without one are
+            not kept, as a follow-up could not re-score them.
+        previous: The session the turn followed up on, whose queries are kept.
+
+    Returns:
+        The new session.
+    """
+    scores = {preference.place_id: preference.score for preference in user_preferences}
+    ranked = sorted(
+        (place for place in places if place.id in rankings and place.id in scores),
+        key=lambda place: scores[place.id],
+        reverse=True,
+    )[:SESSION_TOP_K]
+
+    all_queries: Dict[str, str] = {}
+    for query in [*(previous.queries if previous else []), *queries]:
+        all_queries.setdefault(normalize_query(query), query)
+
+    return Session(
+        messages=messages,
+        queries=list(all_queries.values()),
+        location=location,
+        searchRadius=radius,
+        places=ranked,
+        rankings=[rankings[place.id] for place in ranked],
+    )
@@ -0,0 +1,76 @@
+"""Coalescing of identical in-flight calls.
+
+When members of one group, or groups in the same area, chat at about the
+same time, they issue the same Maps searches and the same scoring prompts
+concurrently. The caches only help once the first call has finished; until
+then every request pays for its own copy. A `SingleFlight` runs one call per
+key and lets every concurrent caller with the same key await its result.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from utils.constants import SINGLE_FLIGHT
+from utils.metrics import count
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """A shared call and the number of callers waiting for it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time, shared by all its callers.
+
+    The call runs in its own task, started by the first caller. A caller that
+    is cancelled stops waiting without affecting the others; the call itself
+    is cancelled once no caller waits for it any more. Failures reach every
+    caller. Nothing is kept once the call is done, so results are only shared
+    with callers that arrive while it runs.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Run `call`, or join the call already running for `key`.
+
+        Args:
+            key: The canonical key of the call, e.g. its cache key.
+            call: Starts the call. Only invoked if no call for `key` is running.
+
+        Returns:
+            The result of the shared call.
+        """
+        if not SINGLE_FLIGHT:
+            return await call()
+
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            count(f"{self.name}_coalesced")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            # Only reached before completion when the last waiter was cancelled
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def __len__(self) -> int:
+        return len(self._flights)
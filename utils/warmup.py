@@ -0,0 +1,85 @@
+"""Warm-up of the shared clients at startup, and the readiness it gates.
+
+A fresh worker would otherwise pay for DNS, TCP and TLS setup to Maps and
+Gemini, and for creating the Gemini client, on the critical path of its first
+chats. The app lifespan starts a `WarmUp` in the background: it opens pooled
+Maps connections and creates the Gemini client and opens its connections with
+cheap model metadata calls. `/readyz` reports ready once it has finished, so
+a load balancer only routes chats to warm workers. A warm-up that fails or
+times out is logged and the worker becomes ready anyway, as it can still
+serve, only more slowly at first.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from utils.constants import (
+    LITE_MODEL,
+    WARMUP_MAPS_CONNECTIONS,
+    WARMUP_LLM_CONNECTIONS,
+    WARMUP_TIMEOUT_SECONDS,
+)
+from utils.llm import scheduler
+from utils.maps import maps_client
+from utils.metrics import count, span
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_maps() -> None:
+    """Open `WARMUP_MAPS_CONNECTIONS` pooled Maps connections."""
+    await maps_client.warm(WARMUP_MAPS_CONNECTIONS)
+
+
+async def warm_llm() -> None:
+    """Create the Gemini client and open `WARMUP_LLM_CONNECTIONS` connections."""
+    client = scheduler.client
+    await asyncio.gather(
+        *[client.aio.models.get(model=LITE_MODEL) for _ in range(WARMUP_LLM_CONNECTIONS)]
+    )
+
+
+class WarmUp:
+    """Background warm-up of the shared clients."""
+
+    def __init__(self):
+        self.ready = False
+        self.results: Dict[str, str] = {}  # Client -> "ok", "failed" or "timeout"
+        self._task: Optional[asyncio.Task] = None
+
+    async def _warm(self, name: str, warm: Callable[[], Awaitable[None]]) -> None:
+        start = time.perf_counter()
+        try:
+            with span(f"warmup_{name}"):
+                await asyncio.wait_for(warm(), WARMUP_TIMEOUT_SECONDS)
+            self.results[name] = "ok"
+            logger.info("Warmed up %s in %.2fs", name, time.perf_counter() - start)
+        except asyncio.TimeoutError:
+            self.results[name] = "timeout"
+            count("warmup_failures")
+            logger.warning("Warm-up of %s timed out", name)
+        except Exception as e:
+            self.results[name] = "failed"
+            count("warmup_failures")
+            logger.warning("Warm-up of %s failed: %r", name, e)
+
+    async def _run(self) -> None:
+        await asyncio.gather(self._warm("maps", warm_maps), self._warm("llm", warm_llm))
+        self.ready = True
+
+    def start(self) -> None:
+        """Start warming up in the background."""
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the warm-up if it is still running."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+warmup = WarmUp()